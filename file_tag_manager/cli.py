@@ -1,46 +1,130 @@
 """命令行接口"""
 import os
+import functools
 import click
-from typing import List
-from .core import FileManager, TagManager
-import json
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from .core.config import DEFAULT_CONFIG_DIR
+from .utils import load_file
+
+if TYPE_CHECKING:
+    # 核心模块依赖 watchdog 等较重的包，只在命令真正需要时导入
+    from .core import FileManager, TagManager
 
 class Context:
     def __init__(self):
         """初始化 CLI 上下文"""
         self.file_manager = None
         self.tag_manager = None
+        # 已解析的 JSON 配置缓存，键为 (文件路径, 修改时间)
+        self._json_cache: Dict[Tuple[str, float], Dict] = {}
+
+    def load_json(self, path: str) -> Optional[Dict]:
+        """读取 JSON 配置文件，同一文件未修改时直接返回缓存结果
+
+        Args:
+            path: 配置文件路径
+
+        Returns:
+            解析后的数据，文件不存在或为空时返回 None
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if not st.st_size:
+            return None
+        mtime = st.st_mtime
+
+        key = (path, mtime)
+        if key not in self._json_cache:
+            self._json_cache[key] = load_file(path)
+        return self._json_cache[key]
 
 pass_context = click.make_pass_decorator(Context, ensure=True)
 
+# 出现任一字符即说明不是纯扩展名模式
+_GLOB_META = frozenset('/*!')
+
+@functools.lru_cache(maxsize=1024)
+def _process_pattern(pattern: str) -> str:
+    """处理文件模式，统一格式"""
+    pattern = pattern.strip().replace('\\', '/')
+
+    # 处理扩展名模式
+    if _GLOB_META.isdisjoint(pattern):
+        # 如果是纯扩展名，添加 *. 前缀
+        return f"*.{pattern.lstrip('.')}"
+
+    # 处理目录模式
+    if pattern.endswith('/'):
+        return f"{pattern}*"
+
+    return pattern
+
+def _resolve_existing(path: str) -> Optional[str]:
+    """返回路径的绝对路径，路径不存在时返回 None
+
+    只调用一次 os.stat，代替 os.path.abspath + os.path.exists 的组合。
+    """
+    path = os.path.abspath(path)
+    try:
+        os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return path
+
+def _echo_lines(lines: Iterable[str], chunk_size: int = 1000) -> None:
+    """分批输出多行文本
+
+    每 chunk_size 行合并为一次写入，既减少大量结果时的写入次数，
+    又不必等到所有结果生成后才开始输出。
+    """
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= chunk_size:
+            click.echo("\n".join(buffer))
+            buffer.clear()
+    if buffer:
+        click.echo("\n".join(buffer))
+
+def _format_tag(tag_id: str, tag) -> str:
+    """格式化标签信息用于输出"""
+    parent_info = f" (父标签: {tag.parent})" if tag.parent else ""
+    description = f"\n    描述: {tag.description}" if tag.description else ""
+    return f"  - {tag.name} (ID: {tag_id}){parent_info}{description}"
+
 @click.group()
 @click.pass_context
 def cli(ctx):
     """文件标签管理工具"""
     ctx.obj = Context()
 
-def _get_file_manager(ctx: Context, config_dir: str = None) -> FileManager:
+def _get_file_manager(ctx: Context, config_dir: str = None) -> 'FileManager':
     """从配置文件获取 FileManager 实例"""
     if ctx.obj.file_manager:
         return ctx.obj.file_manager
 
-    storage_path = os.path.join(config_dir if config_dir else os.path.expanduser("~/.file_tag_manager"), "files.json")
-    if os.path.exists(storage_path):
-        with open(storage_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            root_dir = data.get('root_dir', '.')
-    else:
-        root_dir = '.'
+    from .core.file_manager import FileManager
+
+    storage_path = os.path.join(config_dir or DEFAULT_CONFIG_DIR, "files.json")
+    data = ctx.obj.load_json(storage_path)
+    root_dir = data.get('root_dir', '.') if data else '.'
 
-    ctx.obj.file_manager = FileManager(root_dir, config_dir=config_dir)
+    ctx.obj.file_manager = FileManager(root_dir, config_dir=config_dir, preloaded_data=data)
     return ctx.obj.file_manager
 
-def _get_tag_manager(ctx: Context, config_dir: str = None) -> TagManager:
+def _get_tag_manager(ctx: Context, config_dir: str = None) -> 'TagManager':
     """从配置文件获取 TagManager 实例"""
     if ctx.obj.tag_manager:
         return ctx.obj.tag_manager
 
-    ctx.obj.tag_manager = TagManager(config_dir=config_dir)
+    from .core.tag_manager import TagManager
+
+    tags_file = os.path.join(config_dir or DEFAULT_CONFIG_DIR, "tags.json")
+    data = ctx.obj.load_json(tags_file)
+
+    ctx.obj.tag_manager = TagManager(config_dir=config_dir, preloaded_data=data)
     return ctx.obj.tag_manager
 
 @cli.command()
@@ -59,9 +143,13 @@ def _get_tag_manager(ctx: Context, config_dir: str = None) -> TagManager:
 
 多个模式可以多次使用此选项''')
 @click.option('--recursive/--no-recursive', default=True, help='是否递归监控子目录')
+@click.option('--backend', type=click.Choice(['auto', 'inotify', 'polling']),
+              help='监控后端：auto 在网络文件系统上自动使用轮询，inotify 使用系统原生通知，polling 定期检查；'
+                   '默认沿用保存的配置，没有保存时为 auto')
+@click.option('--poll-interval', type=click.FloatRange(min=0, min_open=True), help='轮询模式下的检查间隔（秒），默认为 30 秒')
 @click.option('--config-dir', help='配置文件目录，默认为 ~/.file_tag_manager')
 @click.pass_context
-def init(ctx: Context, directory: str, patterns: List[str], recursive: bool, config_dir: str):
+def init(ctx: Context, directory: str, patterns: List[str], recursive: bool, backend: Optional[str], poll_interval: Optional[float], config_dir: str):
     """初始化文件监控。
 
     支持两种模式格式：
@@ -76,30 +164,16 @@ def init(ctx: Context, directory: str, patterns: List[str], recursive: bool, con
        - /src/*.py：从项目根目录开始匹配
        - !!docs/api/*：重新包含已排除目录中的特定子目录
     """
-    directory = os.path.abspath(directory)
-    if not os.path.exists(directory):
-        click.echo(f"目录不存在: {directory}")
+    resolved = _resolve_existing(directory)
+    if resolved is None:
+        click.echo(f"目录不存在: {os.path.abspath(directory)}")
         return
+    directory = resolved
 
     # 分离包含模式和排除模式
     include_patterns = []
     exclude_patterns = []
-    
-    def _process_pattern(pattern: str) -> str:
-        """处理文件模式，统一格式"""
-        pattern = pattern.strip().replace('\\', '/')
-        
-        # 处理扩展名模式
-        if not ('/' in pattern or '*' in pattern or '!' in pattern):
-            # 如果是纯扩展名，添加 *. 前缀
-            return f"*.{pattern.lstrip('.')}"
-        
-        # 处理目录模式
-        if pattern.endswith('/'):
-            return f"{pattern}*"
-        
-        return pattern
-    
+
     if patterns:
         for pattern in patterns:
             pattern = pattern.strip()
@@ -115,12 +189,17 @@ def init(ctx: Context, directory: str, patterns: List[str], recursive: bool, con
     else:
         include_patterns = ["*"]
 
+    from .core.file_manager import FileManager
+    from .core.tag_manager import TagManager
+
     ctx.obj.file_manager = FileManager(
         directory,
         include_patterns=include_patterns,
         exclude_patterns=exclude_patterns,
         recursive=recursive,
-        config_dir=config_dir
+        config_dir=config_dir,
+        backend=backend,
+        poll_interval=poll_interval
     )
     ctx.obj.tag_manager = TagManager(config_dir=config_dir)
 
@@ -134,6 +213,9 @@ def init(ctx: Context, directory: str, patterns: List[str], recursive: bool, con
         for pattern in exclude_patterns:
             click.echo(f"  - {pattern}")
     click.echo(f"递归监控子目录: {recursive}")
+    click.echo(f"监控后端: {ctx.obj.file_manager.backend}")
+    if ctx.obj.file_manager.backend != 'inotify':
+        click.echo(f"轮询间隔: {ctx.obj.file_manager.poll_interval} 秒")
 
 @cli.command()
 @click.pass_context
@@ -150,7 +232,7 @@ def list_patterns(ctx: Context, config_dir: str):
     # 显示包含模式
     click.echo("当前文件包含模式:")
     if file_manager.include_patterns:
-        for pattern in file_manager.include_patterns:
+        for pattern in sorted(file_manager.include_patterns):
             click.echo(f"  - {pattern}")
     else:
         click.echo("  (无)")
@@ -158,7 +240,7 @@ def list_patterns(ctx: Context, config_dir: str):
     # 显示排除模式
     click.echo("\n当前文件排除模式:")
     if file_manager.exclude_patterns:
-        for pattern in file_manager.exclude_patterns:
+        for pattern in sorted(file_manager.exclude_patterns):
             click.echo(f"  - {pattern}")
     else:
         click.echo("  (无)")
@@ -184,30 +266,23 @@ def add_pattern(ctx: Context, pattern: str, config_dir: str):
     """
     file_manager = _get_file_manager(ctx, config_dir)
     
-    # 统一路径分隔符
-    pattern = pattern.strip().replace('\\', '/')
-    
-    # 处理扩展名模式
-    if not ('/' in pattern or '*' in pattern or '!' in pattern):
-        # 如果是纯扩展名，添加 *. 前缀
-        pattern = f"*.{pattern.lstrip('.')}"
-    # 处理目录模式
-    elif pattern.endswith('/'):
-        pattern = f"{pattern}*"
-    
+    pattern = _process_pattern(pattern)
+
     if pattern.startswith('!'):
         # 排除模式添加到 exclude_patterns
         if pattern not in file_manager.exclude_patterns:
-            file_manager.exclude_patterns.append(pattern)
-            file_manager._save_data()
+            file_manager.exclude_patterns.add(pattern)
+            file_manager._recompile_patterns()
+            file_manager.save()
             click.echo(f"添加文件排除模式: {pattern}")
         else:
             click.echo(f"文件排除模式 {pattern} 已存在")
     else:
         # 包含模式添加到 include_patterns
         if pattern not in file_manager.include_patterns:
-            file_manager.include_patterns.append(pattern)
-            file_manager._save_data()
+            file_manager.include_patterns.add(pattern)
+            file_manager._recompile_patterns()
+            file_manager.save()
             click.echo(f"添加文件包含模式: {pattern}")
         else:
             click.echo(f"文件包含模式 {pattern} 已存在")
@@ -233,17 +308,8 @@ def remove_pattern(ctx: Context, pattern: str, config_dir: str):
     """
     file_manager = _get_file_manager(ctx, config_dir)
     
-    # 统一路径分隔符
-    pattern = pattern.strip().replace('\\', '/')
-    
-    # 处理扩展名模式
-    if not ('/' in pattern or '*' in pattern or '!' in pattern):
-        # 如果是纯扩展名，添加 *. 前缀
-        pattern = f"*.{pattern.lstrip('.')}"
-    # 处理目录模式
-    elif pattern.endswith('/'):
-        pattern = f"{pattern}*"
-    
+    pattern = _process_pattern(pattern)
+
     # 检查原始模式和转换后的模式
     patterns_to_check = {pattern}
     if pattern.startswith('*.'):
@@ -255,18 +321,21 @@ def remove_pattern(ctx: Context, pattern: str, config_dir: str):
     # 先检查是否是排除模式
     if pattern.startswith('!'):
         if pattern in file_manager.exclude_patterns:
-            file_manager.exclude_patterns.remove(pattern)
-            file_manager._save_data()
+            file_manager.exclude_patterns.discard(pattern)
+            file_manager._recompile_patterns()
+            file_manager.save()
             click.echo(f"移除文件排除模式: {pattern}")
             return
     else:
         # 检查包含模式
-        for p in patterns_to_check:
-            if p in file_manager.include_patterns:
-                file_manager.include_patterns.remove(p)
-                file_manager._save_data()
+        removed = patterns_to_check & file_manager.include_patterns
+        if removed:
+            file_manager.include_patterns -= removed
+            file_manager._recompile_patterns()
+            file_manager.save()
+            for p in sorted(removed):
                 click.echo(f"移除文件包含模式: {p}")
-                return
+            return
     
     click.echo(f"未找到匹配的模式: {pattern}")
 
@@ -277,8 +346,7 @@ def list_directories(ctx: Context, config_dir: str):
     """列出当前监控的目录"""
     file_manager = _get_file_manager(ctx, config_dir)
     click.echo("当前监控的目录:")
-    for directory in sorted(file_manager.directories):
-        click.echo(f"  - {directory}")
+    _echo_lines(f"  - {directory}" for directory in sorted(file_manager.directories))
 
 @cli.command()
 @click.pass_context
@@ -314,10 +382,7 @@ def list_tags(ctx: Context, config_dir: str):
         return
     
     click.echo("所有标签:")
-    for tag_id, tag in tags.items():
-        parent_info = f" (父标签: {tag.parent})" if tag.parent else ""
-        description = f"\n    描述: {tag.description}" if tag.description else ""
-        click.echo(f"  - {tag.name} (ID: {tag_id}){parent_info}{description}")
+    _echo_lines(_format_tag(tag_id, tag) for tag_id, tag in tags.items())
 
 @cli.command()
 @click.pass_context
@@ -331,17 +396,19 @@ def add_file_tags(ctx: Context, file_path: str, tag_ids: List[str], config_dir:
         return
 
     tag_manager = _get_tag_manager(ctx, config_dir)
-    file_path = os.path.abspath(file_path)
-    if not os.path.exists(file_path):
-        click.echo(f"文件不存在: {file_path}")
+    resolved = _resolve_existing(file_path)
+    if resolved is None:
+        click.echo(f"文件不存在: {os.path.abspath(file_path)}")
         return
+    file_path = resolved
 
+    valid_ids = [tag_id for tag_id in tag_ids if tag_manager.get_tag(tag_id)]
+    tag_manager.add_tags_to_file(file_path, valid_ids)
     for tag_id in tag_ids:
-        try:
-            tag_manager.add_tag_to_file(file_path, tag_id)
+        if tag_id in valid_ids:
             click.echo(f"已为文件 {file_path} 添加标签: {tag_id}")
-        except ValueError as e:
-            click.echo(str(e))
+        else:
+            click.echo(f"标签 {tag_id} 不存在")
 
 @cli.command()
 @click.pass_context
@@ -355,13 +422,14 @@ def remove_file_tags(ctx: Context, file_path: str, tag_ids: List[str], config_di
         return
 
     tag_manager = _get_tag_manager(ctx, config_dir)
-    file_path = os.path.abspath(file_path)
-    if not os.path.exists(file_path):
-        click.echo(f"文件不存在: {file_path}")
+    resolved = _resolve_existing(file_path)
+    if resolved is None:
+        click.echo(f"文件不存在: {os.path.abspath(file_path)}")
         return
+    file_path = resolved
 
+    tag_manager.remove_tags_from_file(file_path, tag_ids)
     for tag_id in tag_ids:
-        tag_manager.remove_tag_from_file(file_path, tag_id)
         click.echo(f"已从文件 {file_path} 移除标签: {tag_id}")
 
 @cli.command()
@@ -371,10 +439,11 @@ def remove_file_tags(ctx: Context, file_path: str, tag_ids: List[str], config_di
 def show_tags(ctx: Context, file_path: str, config_dir: str):
     """显示文件的标签"""
     tag_manager = _get_tag_manager(ctx, config_dir)
-    file_path = os.path.abspath(file_path)
-    if not os.path.exists(file_path):
-        click.echo(f"文件不存在: {file_path}")
+    resolved = _resolve_existing(file_path)
+    if resolved is None:
+        click.echo(f"文件不存在: {os.path.abspath(file_path)}")
         return
+    file_path = resolved
 
     tag_ids = tag_manager.get_file_tags(file_path)
     if not tag_ids:
@@ -382,33 +451,33 @@ def show_tags(ctx: Context, file_path: str, config_dir: str):
         return
 
     click.echo(f"文件 {file_path} 的标签:")
-    for tag_id in tag_ids:
-        tag = tag_manager.get_tag(tag_id)
-        if tag:
-            parent_info = f" (父标签: {tag.parent})" if tag.parent else ""
-            description = f"\n    描述: {tag.description}" if tag.description else ""
-            click.echo(f"  - {tag.name} (ID: {tag_id}){parent_info}{description}")
+    tags = tag_manager.get_tags(tag_ids)
+    _echo_lines(_format_tag(tag_id, tag) for tag_id, tag in tags.items())
 
 @cli.command()
 @click.pass_context
 @click.argument('tag_ids', nargs=-1)
 @click.option('--match-all/--match-any', default=False, help='是否要求文件包含所有指定的标签')
+@click.option('--under', help='只查找位于该目录下的文件')
 @click.option('--config-dir', help='配置文件目录，默认为 ~/.file_tag_manager')
-def find_files(ctx: Context, tag_ids: List[str], match_all: bool, config_dir: str):
+def find_files(ctx: Context, tag_ids: List[str], match_all: bool, under: Optional[str], config_dir: str):
     """查找包含指定标签的文件"""
     if not tag_ids:
         click.echo("请指定至少一个标签ID")
         return
 
     tag_manager = _get_tag_manager(ctx, config_dir)
-    files = tag_manager.find_files_by_tags(list(tag_ids), match_all)
-    if not files:
+    if under is not None:
+        under = os.path.abspath(under)
+    files = tag_manager.iter_files_by_tags(tag_ids, match_all, under)
+    first = next(files, None)
+    if first is None:
         click.echo("未找到匹配的文件")
         return
 
     click.echo("找到以下文件:")
-    for file_path in sorted(files):
-        click.echo(f"  - {file_path}")
+    click.echo(f"  - {first}")
+    _echo_lines(f"  - {file_path}" for file_path in files)
 
 if __name__ == '__main__':
     cli()
@@ -1,6 +1,19 @@
 """文件标签管理系统核心模块"""
 
-from .tag_manager import TagManager
-from .file_manager import FileManager
+import importlib
 
-__all__ = ['TagManager', 'FileManager']
+__all__ = ['TagManager', 'FileManager', 'compile_patterns']
+
+# 按需导入子模块，避免只用到标签功能时也加载 watchdog 等依赖
+_EXPORTS = {
+    'TagManager': '.tag_manager',
+    'FileManager': '.file_manager',
+    'compile_patterns': '.file_manager',
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
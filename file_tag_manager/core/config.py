@@ -0,0 +1,5 @@
+"""配置相关常量"""
+import os
+
+# 默认配置文件目录，模块加载时展开一次
+DEFAULT_CONFIG_DIR = os.path.expanduser("~/.file_tag_manager")
@@ -1,297 +1,761 @@
 """文件管理核心模块"""
-from typing import Dict, List, Optional, Set
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Set, Tuple
 import os
+import re
+import sys
+import functools
 import time
-import json
 import fnmatch
 from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
 import threading
+import logging
+from stat import S_ISDIR, S_ISREG
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from ..utils import AsyncSaver, atomic_write, dumps, load_file
+from .config import DEFAULT_CONFIG_DIR
+
+logger = logging.getLogger(__name__)
+
+# fnmatch 会先对路径做 normcase，大小写不敏感的平台上编译时同样忽略大小写
+_PATTERN_FLAGS = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+_CASE_INSENSITIVE = bool(_PATTERN_FLAGS)
+
+
+def _translate(pattern: str) -> str:
+    """把通配符模式转换为正则表达式，去掉结尾的锚点以便组合"""
+    regex = fnmatch.translate(pattern)
+    if regex.endswith(('\\Z', '\\z')):
+        regex = regex[:-2]
+    return regex
+
+
+def compile_patterns(patterns: Iterable[str]) -> Optional[Pattern]:
+    """将多个文件模式合并编译为一个正则表达式
+
+    以 / 开头的模式只匹配完整的相对路径，其余模式可以匹配路径的任意一层，
+    与逐个调用 fnmatch 检查路径每一层的结果一致。相同的模式集合只编译一次。
+
+    Args:
+        patterns: 使用 / 作为分隔符的文件模式
+
+    Returns:
+        编译后的正则表达式，没有模式时返回 None
+    """
+    # 模式顺序不影响匹配结果，排序后作为缓存键
+    return _compile_patterns(tuple(sorted(set(patterns))), 'suffix')
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_patterns(patterns: Tuple[str, ...], mode: str) -> Optional[Pattern]:
+    """编译模式集合
+
+    Args:
+        patterns: 文件模式
+        mode: 不以 / 开头的模式的匹配方式
+            - suffix：匹配路径的任意一层后缀，如 a/b/c 中的 c、b/c、a/b/c
+            - prefix：匹配路径的任意一层前缀，如 a/b/c 中的 a、a/b、a/b/c
+            - full：只匹配完整路径，且不对 / 开头的模式做特殊处理
+    """
+    anchored = []
+    unanchored = []
+    for pattern in patterns:
+        if mode != 'full' and pattern.startswith('/'):
+            anchored.append(_translate(pattern.lstrip('/')))
+        else:
+            unanchored.append(_translate(pattern))
+
+    alternatives = []
+    if unanchored:
+        union = '|'.join(unanchored)
+        if mode == 'suffix':
+            alternatives.append(f'(?s:.*/)?(?:{union})\\Z')
+        elif mode == 'prefix':
+            alternatives.append(f'(?:{union})(?:/|\\Z)')
+        else:
+            alternatives.append(f'(?:{union})\\Z')
+    if anchored:
+        alternatives.append('(?:' + '|'.join(anchored) + ')\\Z')
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives), _PATTERN_FLAGS)
+
+
+def _directory_pattern(pattern: str) -> str:
+    """去掉模式结尾表示目录内容的 /**、/* 或 /，得到匹配目录本身的模式
+
+    反复去掉完整的后缀，src/**/* 得到 src；src* 这类以通配符结尾的目录名模式保持不变。
+    """
+    pattern = pattern.rstrip('/')
+    while pattern.endswith(('/**', '/*')):
+        pattern = pattern[:pattern.rindex('/')].rstrip('/')
+    return pattern
+
+
+@functools.lru_cache(maxsize=16384)
+def _cached_abspath(path: str) -> str:
+    return os.path.abspath(path)
+
+
+@functools.lru_cache(maxsize=16384)
+def _cached_relpath(path: str, start: str) -> str:
+    return os.path.relpath(path, start)
+
+
+def _abspath(path: str) -> str:
+    """返回规范化的绝对路径
+
+    监控事件会反复出现相同的路径，绝对路径的结果只取决于输入字符串，因此缓存；
+    相对路径的结果取决于当前工作目录，不缓存。
+    """
+    if os.path.isabs(path):
+        return _cached_abspath(path)
+    return os.path.abspath(path)
+
+
+def _relpath(path: str, start: str) -> str:
+    """返回 path 相对于绝对路径 start 的相对路径，缓存规则同 _abspath"""
+    if os.path.isabs(path):
+        return _cached_relpath(path, start)
+    return os.path.relpath(path, start)
+
+
+def _has_magic(pattern: str) -> bool:
+    """检查模式中是否含有通配符"""
+    return any(c in pattern for c in '*?[')
+
+
+class _FileMatcher(NamedTuple):
+    """编译后的文件模式集合
+
+    *LITERAL 形式的模式（如 *.py、*.tar.gz）等价于相对路径以 LITERAL 结尾，
+    /LITERAL* 形式的模式（如 /src/*）等价于相对路径以 LITERAL 开头，
+    这两类模式直接用 str.endswith / str.startswith 比较，其余模式合并为正则表达式。
+    """
+    suffixes: Tuple[str, ...]
+    prefixes: Tuple[str, ...]
+    regex: Optional[Pattern]
+
+    def match(self, relative_path: str) -> bool:
+        """检查使用 / 分隔的相对路径是否匹配任一模式"""
+        key = relative_path.lower() if _CASE_INSENSITIVE else relative_path
+        if key.endswith(self.suffixes) or key.startswith(self.prefixes):
+            return True
+        return bool(self.regex and self.regex.match(relative_path))
+
+
+def _compile_file_matcher(patterns: Iterable[str]) -> _FileMatcher:
+    """编译文件模式集合，只需比较前缀或后缀的模式不进入正则表达式"""
+    suffixes = set()
+    prefixes = set()
+    others = []
+    for pattern in patterns:
+        if pattern.startswith('*') and not _has_magic(pattern[1:]):
+            suffixes.add(pattern[1:].lower() if _CASE_INSENSITIVE else pattern[1:])
+        elif pattern.startswith('/') and pattern.endswith('*') and not _has_magic(pattern.lstrip('/')[:-1]):
+            prefix = pattern.lstrip('/')[:-1]
+            prefixes.add(prefix.lower() if _CASE_INSENSITIVE else prefix)
+        else:
+            others.append(pattern)
+    return _FileMatcher(tuple(sorted(suffixes)), tuple(sorted(prefixes)), compile_patterns(others))
+
+
+def _split_literal_patterns(patterns: Iterable[str]) -> Tuple[Tuple[str, ...], FrozenSet[str], List[str]]:
+    """把不含通配符的目录模式从模式列表中分离出来，供前缀匹配模式使用
+
+    Returns:
+        (目录前缀元组, 完整路径集合, 其余模式列表)：不以 / 开头的模式转换为以 / 结尾的前缀，
+        匹配目录本身及其下的所有路径；以 / 开头的模式只匹配完整的相对路径
+    """
+    prefixes = set()
+    exact = set()
+    others = []
+    for pattern in patterns:
+        if _has_magic(pattern):
+            others.append(pattern)
+            continue
+        if _CASE_INSENSITIVE:
+            pattern = pattern.lower()
+        if pattern.startswith('/'):
+            exact.add(pattern.lstrip('/'))
+        else:
+            prefixes.add(pattern + '/')
+    return tuple(sorted(prefixes)), frozenset(exact), others
+
+
+# 这些文件系统上 inotify 等内核通知不可靠，需要改用轮询
+_NETWORK_FILESYSTEMS = frozenset({
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'fuse.sshfs', 'sshfs', 'drvfs', 'afs', 'ncpfs',
+})
+
+def _unescape_mount_path(path: str) -> str:
+    """还原 /proc/mounts 中转义的空格等字符（如 \\040）"""
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), path)
+
+def _is_network_filesystem(path: str) -> bool:
+    """判断路径是否位于网络文件系统上
+
+    通过 /proc/mounts 查找路径所在的挂载点，不支持的平台上返回 False。
+    """
+    try:
+        with open('/proc/mounts', encoding='utf-8', errors='replace') as f:
+            mounts = f.read().splitlines()
+    except OSError:
+        return False
+
+    path = os.path.realpath(path)
+    best_mount, best_type = '', ''
+    for line in mounts:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        mount_point, fs_type = _unescape_mount_path(fields[1]), fields[2]
+        if path == mount_point or path.startswith(os.path.join(mount_point, '')):
+            if len(mount_point) >= len(best_mount):
+                best_mount, best_type = mount_point, fs_type
+    return best_type in _NETWORK_FILESYSTEMS
+
+@functools.lru_cache(maxsize=None)
+def _native_observer_class():
+    """返回当前平台的原生事件观察者类
+
+    Linux 上显式使用 inotify，macOS 上使用 FSEvents，避免原生后端加载失败时
+    watchdog 静默退回到轮询；其他平台由 watchdog 自动选择。
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            from watchdog.observers.inotify import InotifyObserver
+            return InotifyObserver
+        if sys.platform == 'darwin':
+            from watchdog.observers.fsevents import FSEventsObserver
+            return FSEventsObserver
+    except ImportError as e:
+        logger.warning("无法加载原生监控后端，改用 watchdog 默认观察者: %s", e)
+    return Observer
+
+def _iter_entries(directory: str) -> Iterator[Tuple[os.DirEntry, bool]]:
+    """列出目录中的条目及其是否为目录，无法读取的目录或条目会被跳过"""
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                yield entry, is_dir
+    except OSError:
+        return
 
 class FileManager:
-    def __init__(self, root_dir: str, include_patterns: List[str] = None, exclude_patterns: List[str] = None, recursive: bool = True, config_dir: str = None):
+    # 文件事件触发保存后等待的秒数，期间的多次修改合并为一次写入
+    SAVE_DELAY = 0.5
+    # 缓存的路径匹配结果数量上限
+    PATTERN_CACHE_SIZE = 65536
+    PARALLEL_SCAN_THRESHOLD = 4  # 根目录的子目录数超过该值时并发扫描
+    SCAN_WORKERS = 16
+    MONITOR_BACKENDS = ("auto", "inotify", "polling")
+    DEFAULT_POLL_INTERVAL = 30.0  # 轮询模式下两次全量检查之间的秒数
+
+    def __init__(self, root_dir: str, include_patterns: Iterable[str] = None, exclude_patterns: Iterable[str] = None, recursive: bool = True, config_dir: str = None, preloaded_data: Optional[Dict] = None, backend: Optional[str] = None, poll_interval: Optional[float] = None):
         """初始化文件管理器
         
         Args:
             root_dir: 根目录路径
-            include_patterns: 文件包含模式列表，支持以下格式：
+            include_patterns: 文件包含模式，支持以下格式：
                 - 文件扩展名：*.py, *.txt
                 - 目录模式：docs/*, src/**/*
-            exclude_patterns: 文件排除模式列表，格式同上
+            exclude_patterns: 文件排除模式，格式同上
             recursive: 是否递归监控子目录
             config_dir: 配置文件目录，默认为 ~/.file_tag_manager
+            preloaded_data: 已解析的 files.json 内容，提供时跳过读取磁盘
+            backend: 监控后端，为 None 时沿用保存的配置，没有保存时为 auto。可选值：
+                - auto：本地文件系统使用系统原生通知，网络文件系统使用轮询
+                - inotify：使用系统原生通知（Linux 上为 inotify，macOS 上为 FSEvents）
+                - polling：定期检查目录变化
+            poll_interval: 轮询模式下的检查间隔（秒），默认为 30 秒
         """
+        if backend is not None and backend not in self.MONITOR_BACKENDS:
+            raise ValueError(f"不支持的监控后端: {backend}")
+        if poll_interval is not None and poll_interval <= 0:
+            raise ValueError(f"轮询间隔必须大于 0: {poll_interval}")
         self.root_dir = os.path.abspath(root_dir)
-        self.config_dir = os.path.abspath(config_dir) if config_dir else os.path.expanduser("~/.file_tag_manager")
+        self._root_prefix = os.path.join(self.root_dir, '')  # 以路径分隔符结尾的根目录
+        self._root_prefix_len = len(self._root_prefix)
+        self.config_dir = os.path.abspath(config_dir) if config_dir else DEFAULT_CONFIG_DIR
         self.storage_path = os.path.join(self.config_dir, "files.json")
         self.files: Dict[str, Dict] = {}  # {file_path: file_info}
         self.directories: Set[str] = set()  # 存储监控的目录路径
-        self.include_patterns = list(include_patterns) if include_patterns else ["*"]
-        self.exclude_patterns = list(exclude_patterns) if exclude_patterns else []
+        self._dir_to_files: Dict[str, Set[str]] = {}  # {目录: 直接位于其中的已记录文件}
+        self._dir_to_subdirs: Dict[str, Set[str]] = {}  # {目录: 已记录的直接子目录}
+        self.include_patterns: Set[str] = set(include_patterns) if include_patterns else {"*"}
+        self.exclude_patterns: Set[str] = set(exclude_patterns) if exclude_patterns else set()
         self.recursive = recursive  # 是否递归监控子目录
+        self.backend = backend
+        self.poll_interval = poll_interval
         self.observer: Optional[Observer] = None
+        self._event_handler: Optional["FileEventHandler"] = None
         self.file_change_callbacks = []
+        self._save_lock = threading.Lock()
+        self._saver = AsyncSaver(self.flush, self.SAVE_DELAY)  # 在后台线程中合并保存
+        self._dirty = False  # 是否有尚未保存的修改
+        self._bulk = False  # 批量扫描期间只标记修改，扫描结束后统一保存
+        self._pattern_cache: "OrderedDict[Tuple[bool, str], bool]" = OrderedDict()  # (是否为目录, 路径) -> 是否包含
+        self._pattern_cache_lock = threading.Lock()
         os.makedirs(self.config_dir, exist_ok=True)
-        self._load_data()
-        self._scan_directory(self.root_dir)
-        self._save_data()  # 保存初始配置
+        self._load_data(preloaded_data)
+        if self.backend is None:
+            self.backend = "auto"
+        if self.poll_interval is None:
+            self.poll_interval = self.DEFAULT_POLL_INTERVAL
+        self._recompile_patterns()
+        self._scan_directory(self.root_dir)  # 扫描结束时会保存初始配置
     
-    def _should_include_file(self, file_path: str) -> bool:
-        """检查文件是否应该被包含"""
-        # 获取相对于根目录的路径
-        relative_path = os.path.relpath(file_path, self.root_dir)
-        # 将路径分隔符统一为 /
-        relative_path = relative_path.replace('\\', '/')
-        
-        # 分离重新包含模式和普通包含模式
-        reinclude_patterns = []
-        normal_include_patterns = []
+    def _recompile_patterns(self):
+        """根据当前的包含/排除模式重新编译匹配用的正则表达式
+
+        修改 include_patterns 或 exclude_patterns 后需要调用此方法。
+        """
+        include = []
+        reinclude = []
         for pattern in self.include_patterns:
             pattern = pattern.replace('\\', '/')
             if pattern.startswith('!!'):
-                reinclude_patterns.append(pattern[2:])  # 移除 !!
+                reinclude.append(pattern[2:])  # 移除 !!
             else:
-                normal_include_patterns.append(pattern)
-        
-        # 首先检查是否在排除列表中
-        is_excluded = False
+                include.append(pattern)
+        exclude = []
         for pattern in self.exclude_patterns:
-            # 将模式中的路径分隔符统一为 /
-            pattern = pattern.replace('\\', '/').lstrip('!')  # 移除开头的 !
-            # 如果模式不是以 / 开头，需要匹配所有层级的目录
-            if not pattern.startswith('/'):
-                # 检查文件路径的每一层
-                path_parts = relative_path.split('/')
-                for i in range(len(path_parts)):
-                    sub_path = '/'.join(path_parts[i:])
-                    if fnmatch.fnmatch(sub_path, pattern):
-                        is_excluded = True
-                        break
-            else:
-                # 如果模式以 / 开头，只匹配完整路径
-                if fnmatch.fnmatch(relative_path, pattern.lstrip('/')):
-                    is_excluded = True
-                    break
-        
-        # 如果文件被排除，检查是否被重新包含
-        if is_excluded:
-            for pattern in reinclude_patterns:
-                if not pattern.startswith('/'):
-                    # 检查文件路径的每一层
-                    path_parts = relative_path.split('/')
-                    for i in range(len(path_parts)):
-                        sub_path = '/'.join(path_parts[i:])
-                        if fnmatch.fnmatch(sub_path, pattern):
-                            return True
-                else:
-                    # 如果模式以 / 开头，只匹配完整路径
-                    if fnmatch.fnmatch(relative_path, pattern.lstrip('/')):
-                        return True
-            return False
-        
-        # 最后检查是否在普通包含列表中
-        for pattern in normal_include_patterns:
-            if not pattern.startswith('/'):
-                # 检查文件路径的每一层
-                path_parts = relative_path.split('/')
-                for i in range(len(path_parts)):
-                    sub_path = '/'.join(path_parts[i:])
-                    if fnmatch.fnmatch(sub_path, pattern):
-                        return True
-            else:
-                # 如果模式以 / 开头，只匹配完整路径
-                if fnmatch.fnmatch(relative_path, pattern.lstrip('/')):
-                    return True
-        
-        return False
+            pattern = pattern.replace('\\', '/')
+            # 排除模式以单个 ! 标记，只移除这一个
+            exclude.append(pattern[1:] if pattern.startswith('!') else pattern)
+
+        # 目录排除模式匹配目录自身或任一上级目录，结尾的 /、/* 和 /** 不参与比较；
+        # 被排除的目录如果自身或其子路径匹配包含模式则仍然保留
+        dir_exclude = {
+            '/' + _directory_pattern(pattern.lstrip('/')) if pattern.startswith('/') else _directory_pattern(pattern)
+            for pattern in exclude
+        }
+        dir_include = {pattern.replace('\\', '/') for pattern in self.include_patterns}
+        # 不含通配符的排除目录直接比较前缀，其余模式合并为正则表达式
+        self._dir_exclude_prefixes, self._dir_exclude_exact, dir_exclude = _split_literal_patterns(dir_exclude)
+        self._dir_exclude_re = _compile_patterns(tuple(sorted(dir_exclude)), 'prefix')
+        self._dir_include_re = _compile_patterns(tuple(sorted({_directory_pattern(p) for p in dir_include})), 'full')
+        self._dir_include_children_re = _compile_patterns(tuple(sorted(dir_include)), 'full')
+
+        self._include_matcher = _compile_file_matcher(include)
+        self._reinclude_matcher = _compile_file_matcher(reinclude)
+        self._exclude_matcher = _compile_file_matcher(exclude)
+        self.clear_pattern_cache()
+
+    def clear_pattern_cache(self):
+        """清空缓存的路径匹配结果"""
+        with self._pattern_cache_lock:
+            self._pattern_cache.clear()
+
+    def _cached_match(self, is_dir: bool, path: str) -> Optional[bool]:
+        """读取缓存的匹配结果，未缓存时返回 None"""
+        key = (is_dir, path)
+        with self._pattern_cache_lock:
+            result = self._pattern_cache.get(key)
+            if result is not None:
+                self._pattern_cache.move_to_end(key)
+            return result
+
+    def _cache_match(self, is_dir: bool, path: str, result: bool) -> bool:
+        """缓存匹配结果，超出上限时淘汰最久未使用的记录"""
+        with self._pattern_cache_lock:
+            self._pattern_cache[(is_dir, path)] = result
+            if len(self._pattern_cache) > self.PATTERN_CACHE_SIZE:
+                self._pattern_cache.popitem(last=False)
+        return result
+
+    def _should_include_file(self, file_path: str) -> bool:
+        """检查文件是否应该被包含"""
+        result = self._cached_match(False, file_path)
+        if result is None:
+            result = self._cache_match(False, file_path, self._match_file(file_path))
+        return result
+
+    def _match_file(self, file_path: str) -> bool:
+        """根据包含/排除模式判断文件是否应该被包含"""
+        # 获取相对于根目录的路径，并将路径分隔符统一为 /
+        relative_path = self._relative_path(file_path).replace('\\', '/')
+
+        # 被排除的文件只有匹配重新包含模式时才保留
+        if self._exclude_matcher.match(relative_path):
+            return self._reinclude_matcher.match(relative_path)
+
+        return self._include_matcher.match(relative_path)
 
     def _should_include_directory(self, dir_path: str) -> bool:
         """检查目录是否应该被包含"""
-        # 获取相对于根目录的路径
-        relative_path = os.path.relpath(dir_path, self.root_dir)
-        # 将路径分隔符统一为 /
-        relative_path = relative_path.replace('\\', '/')
-        
-        # 先检查是否在排除列表中
-        for pattern in self.exclude_patterns:
-            pattern = pattern.replace('\\', '/').lstrip('!')  # 移除开头的 !
-            if not pattern.startswith('/'):
-                # 检查当前目录及其所有父目录是否被排除
-                path_parts = relative_path.split('/')
-                current_path = ""
-                for part in path_parts:
-                    if current_path:
-                        current_path += "/"
-                    current_path += part
-                    # 检查当前路径是否匹配排除模式
-                    if fnmatch.fnmatch(current_path, pattern.rstrip('/*')):
-                        # 检查是否有包含模式匹配这个目录
-                        for include_pattern in self.include_patterns:
-                            include_pattern = include_pattern.replace('\\', '/')
-                            if fnmatch.fnmatch(relative_path, include_pattern.rstrip('/*')):
-                                return True
-                            if fnmatch.fnmatch(relative_path + "/*", include_pattern):
-                                return True
-                        return False
-            else:
-                # 如果模式以 / 开头，只匹配完整路径
-                if fnmatch.fnmatch(relative_path, pattern.lstrip('/').rstrip('/*')):
-                    # 检查是否有包含模式匹配这个目录
-                    for include_pattern in self.include_patterns:
-                        include_pattern = include_pattern.replace('\\', '/')
-                        if fnmatch.fnmatch(relative_path, include_pattern.rstrip('/*')):
-                            return True
-                        if fnmatch.fnmatch(relative_path + "/*", include_pattern):
-                            return True
-                    return False
-        
-        # 如果没有被排除，检查是否在包含列表中
-        for pattern in self.include_patterns:
-            pattern = pattern.replace('\\', '/')
-            if not pattern.startswith('/'):
-                # 检查目录路径的每一层
-                path_parts = relative_path.split('/')
-                for i in range(len(path_parts)):
-                    sub_path = '/'.join(path_parts[i:])
-                    if fnmatch.fnmatch(sub_path, pattern.rstrip('/*')):
-                        return True
-            else:
-                if fnmatch.fnmatch(relative_path, pattern.lstrip('/').rstrip('/*')):
-                    return True
-        
-        # 如果既没有被排除也没有被包含，返回 True（默认包含所有目录）
-        return True
-
-    def _load_data(self):
-        """从 JSON 文件加载文件和目录信息"""
-        if os.path.exists(self.storage_path):
-            with open(self.storage_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 只有当根目录相同时才加载配置
-                if data.get('root_dir') == self.root_dir:
-                    self.files = data.get('files', {})
-                    self.directories = set(data.get('directories', []))
-                    # 不要覆盖初始化时设置的模式
-                    if not self.include_patterns or self.include_patterns == ["*"]:
-                        self.include_patterns = data.get('include_patterns', ["*"])
-                    if not self.exclude_patterns:
-                        self.exclude_patterns = data.get('exclude_patterns', [])
-                    self.recursive = data.get('recursive', True)
+        result = self._cached_match(True, dir_path)
+        if result is None:
+            result = self._cache_match(True, dir_path, self._match_directory(dir_path))
+        return result
+
+    def _match_directory(self, dir_path: str) -> bool:
+        """根据包含/排除模式判断目录是否应该被包含"""
+        # 获取相对于根目录的路径，并将路径分隔符统一为 /
+        relative_path = self._relative_path(dir_path).replace('\\', '/')
+
+        # 没有被排除的目录默认全部包含
+        if not self._is_directory_excluded(relative_path):
+            return True
+
+        # 被排除的目录，检查是否有包含模式匹配这个目录或其中的文件
+        if self._dir_include_re and self._dir_include_re.match(relative_path):
+            return True
+        return bool(self._dir_include_children_re and self._dir_include_children_re.match(relative_path + "/*"))
+
+    def _is_directory_excluded(self, relative_path: str) -> bool:
+        """检查目录是否匹配目录排除模式"""
+        key = relative_path.lower() if _CASE_INSENSITIVE else relative_path
+        if key in self._dir_exclude_exact or (key + '/').startswith(self._dir_exclude_prefixes):
+            return True
+        return bool(self._dir_exclude_re and self._dir_exclude_re.match(relative_path))
+
+    def _load_data(self, data: Optional[Dict] = None):
+        """从 JSON 文件加载文件和目录信息
+
+        Args:
+            data: 已解析的 files.json 内容，为 None 时从磁盘读取
+        """
+        if data is None:
+            if not os.path.exists(self.storage_path):
+                return
+            data = load_file(self.storage_path)
+
+        # 只有当根目录相同时才加载配置
+        if data.get('root_dir') == self.root_dir:
+            self.files = dict(data.get('files', {}))
+            self.directories = set(data.get('directories', []))
+            # 不要覆盖初始化时设置的模式
+            if not self.include_patterns or self.include_patterns == {"*"}:
+                self.include_patterns = set(data.get('include_patterns', ["*"]))
+            if not self.exclude_patterns:
+                self.exclude_patterns = set(data.get('exclude_patterns', []))
+            self.recursive = data.get('recursive', True)
+            if self.backend is None:
+                backend = data.get('backend', "auto")
+                if backend in self.MONITOR_BACKENDS:
+                    self.backend = backend
+                else:
+                    logger.warning("忽略保存的未知监控后端: %s", backend)
+            if self.poll_interval is None:
+                self.poll_interval = data.get('poll_interval')
     
     def _save_data(self):
-        """保存文件和目录信息到 JSON 文件"""
+        """保存文件和目录信息到 JSON 文件
+
+        内容与磁盘上的文件相同时跳过写入，否则通过临时文件原子替换。
+        """
+        # 先复制一份，避免监控线程在序列化过程中修改字典
         data = {
             'root_dir': self.root_dir,
-            'files': self.files,
-            'directories': list(self.directories),
-            'include_patterns': self.include_patterns,
-            'exclude_patterns': self.exclude_patterns,
-            'recursive': self.recursive
+            'files': dict(sorted(self.files.items())),
+            'directories': sorted(self.directories),
+            'include_patterns': sorted(self.include_patterns),
+            'exclude_patterns': sorted(self.exclude_patterns),
+            'recursive': self.recursive,
+            'backend': self.backend,
+            'poll_interval': self.poll_interval
         }
-        with open(self.storage_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # files.json 是程序维护的状态文件，使用紧凑格式
+        content = dumps(data)
+
+        # 内容没有变化时不重写文件
+        try:
+            with open(self.storage_path, 'rb') as f:
+                if f.read() == content:
+                    return
+        except FileNotFoundError:
+            pass
+
+        atomic_write(self.storage_path, content)
+
+    def _schedule_save(self):
+        """标记有待保存的修改，并在 SAVE_DELAY 秒内没有新修改时由后台线程写入磁盘
+
+        调用方（包括监控事件线程）不会被序列化和写入阻塞。
+        """
+        with self._save_lock:
+            self._dirty = True
+            if not self._bulk:
+                self._saver.request()
+
+    def save(self):
+        """立即保存当前状态，例如修改了包含/排除模式之后"""
+        with self._save_lock:
+            self._dirty = True
+        self.flush()
+
+    def flush(self):
+        """立即保存尚未写入磁盘的修改"""
+        with self._save_lock:
+            self._saver.cancel()
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._save_data()
     
-    def _scan_directory(self, directory):
-        """扫描目录并更新文件信息"""
-        directory = os.path.abspath(directory)
-        
-        # 清除现有记录
+    def _clear_records(self):
+        """清除记录的文件、目录及其索引"""
         self.files.clear()
         self.directories.clear()
+        self._dir_to_files.clear()
+        self._dir_to_subdirs.clear()
+
+    def reset(self):
+        """停止监控并清空记录的文件、目录和变更回调
+
+        保留根目录、模式等配置，清空后的状态会被保存，之后可以重新扫描。
+        """
+        self.stop_monitoring()
+        self._clear_records()
+        self.file_change_callbacks.clear()
+        self._schedule_save()
+
+    def _scan_directory(self, directory):
+        """扫描目录并更新文件信息"""
+        directory = _abspath(directory)
+        self._clear_records()
         
         # 添加根目录
         self.directories.add(directory)
+        self._index_directory(directory)
         self._notify_file_change('directory_created', directory)
 
-        for root, dirs, files in os.walk(directory):
-            # 如果不是递归模式，跳过子目录
-            if not self.recursive and root != directory:
-                continue
+        self._bulk = True
+        try:
+            for subdirs, files in self._walk(directory):
+                for path, _ in subdirs:
+                    if self._should_include_directory(path):
+                        self.directories.add(path)
+                        self._index_directory(path)
+                        self._notify_file_change('directory_created', path)
+                for entry in files:
+                    self._add_file_from_entry(entry)
+        finally:
+            self._bulk = False
 
-            # 添加子目录
-            for dir_name in dirs:
-                dir_path = os.path.abspath(os.path.join(root, dir_name))
-                if self.recursive or os.path.dirname(dir_path) == directory:
-                    if self._should_include_directory(dir_path):
-                        self.directories.add(dir_path)
-                        self._notify_file_change('directory_created', dir_path)
-
-            # 添加文件
-            for file_name in files:
-                file_path = os.path.abspath(os.path.join(root, file_name))
-                if self._should_include_file(file_path):
-                    self._add_file(file_path)
-        
-        self._save_data()
+        self._dirty = True
+        self.flush()
 
-    def _add_file(self, file_path: str):
-        """添加文件到管理器"""
+    def _walk(self, directory: str) -> Iterator[Tuple[List[Tuple[str, bool]], List[os.DirEntry]]]:
+        """遍历目录树，逐个目录产出 _read_directory 的结果
+
+        先串行遍历，待读取的子目录超过 PARALLEL_SCAN_THRESHOLD 个时改用线程池并发读取，
+        以重叠网络文件系统等高延迟存储上的 I/O 等待；产出结果的顺序不保证与目录结构一致。
+        """
+        first = self._read_directory(directory)
+        yield first
+        pending = [path for path, is_link in first[0] if self.recursive and not is_link]
+
+        # 只有一两个顶层目录的深层目录树也会在展开后切换到并发读取
+        while pending and len(pending) <= self.PARALLEL_SCAN_THRESHOLD:
+            result = self._read_directory(pending.pop())
+            pending.extend(path for path, is_link in result[0] if not is_link)
+            yield result
+        if not pending:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as executor:
+            futures = {executor.submit(self._read_directory, path) for path in pending}
+            try:
+                while futures:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        futures.update(
+                            executor.submit(self._read_directory, path)
+                            for path, is_link in result[0] if not is_link
+                        )
+                        yield result
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _read_directory(self, directory: str) -> Tuple[List[Tuple[str, bool]], List[os.DirEntry]]:
+        """读取目录的直接子目录和需要记录的文件，可以在工作线程中调用
+
+        Args:
+            directory: 目录路径
+
+        Returns:
+            ([(子目录路径, 是否为符号链接)], 文件条目列表)，文件条目的 stat 信息已经读取并缓存
+        """
+        subdirs = []
+        files = []
+        for entry, is_dir in _iter_entries(directory):
+            if is_dir:
+                # 与 os.walk 一致，不进入指向目录的符号链接
+                subdirs.append((entry.path, entry.is_symlink()))
+            elif self._should_include_file(entry.path):
+                # 在工作线程中读取 stat，DirEntry 会缓存结果
+                try:
+                    if entry.is_file():
+                        entry.stat()
+                        files.append(entry)
+                except OSError:
+                    pass
+        return subdirs, files
+
+    def _relative_path(self, abs_path: str) -> str:
+        """返回规范化的绝对路径相对于根目录的路径
+
+        根目录下的路径直接截去根目录前缀，只有根目录本身或根目录之外的路径才调用 relpath。
+        """
+        if abs_path.startswith(self._root_prefix):
+            return abs_path[self._root_prefix_len:]
+        return _relpath(abs_path, self.root_dir)
+
+    def _record_file(self, abs_path: str, stat: os.stat_result):
+        """根据 stat 信息记录文件"""
+        # 驻留路径字符串，与 TagManager 中相同的文件路径共享同一个对象
+        abs_path = sys.intern(abs_path)
+        self.files[abs_path] = {
+            'size': stat.st_size,
+            'created_time': stat.st_ctime,
+            'modified_time': stat.st_mtime,
+            'relative_path': self._relative_path(abs_path)
+        }
+        self._index_file(abs_path)
+
+    def _add_file_from_entry(self, entry: os.DirEntry):
+        """记录扫描得到的文件，直接使用 DirEntry 的绝对路径和缓存的 stat 信息"""
+        self._record_file(entry.path, entry.stat())
+
+    def _stat_file(self, file_path: str) -> Optional[Tuple[str, os.stat_result]]:
+        """读取文件的绝对路径和 stat 信息，不修改管理器的状态
+
+        Returns:
+            (绝对路径, stat 信息)，路径不是文件或读取失败时返回 None
+        """
+        abs_path = _abspath(file_path)
+        # 一次 stat 同时判断是否存在、是否为普通文件并取得文件信息
         try:
-            abs_path = os.path.abspath(file_path)
-            if os.path.exists(abs_path) and os.path.isfile(abs_path):
-                stat = os.stat(abs_path)
-                rel_path = os.path.relpath(abs_path, self.root_dir)
-                self.files[abs_path] = {
-                    'size': stat.st_size,
-                    'created_time': stat.st_ctime,
-                    'modified_time': stat.st_mtime,
-                    'relative_path': rel_path
-                }
-                self._save_data()
-        except Exception as e:
-            print(f"Error adding file {file_path}: {e}")
+            st = os.stat(abs_path)
+        except (OSError, ValueError):
+            return None
+        if not S_ISREG(st.st_mode):
+            return None
+        return abs_path, st
 
     def _add_directory(self, dir_path: str):
         """添加目录到管理器"""
+        abs_path = _abspath(dir_path)
+        # 一次 stat 同时判断是否存在以及是否为目录
         try:
-            abs_path = os.path.abspath(dir_path)
-            if os.path.exists(abs_path) and os.path.isdir(abs_path):
-                if self.recursive or os.path.dirname(abs_path) == self.root_dir:
-                    if self._should_include_directory(abs_path):
-                        self.directories.add(abs_path)
-                        self._notify_file_change('directory_created', abs_path)
-                        self._save_data()
-        except Exception as e:
-            print(f"Error adding directory {dir_path}: {e}")
+            if not S_ISDIR(os.stat(abs_path).st_mode):
+                return
+        except (OSError, ValueError):
+            return
+
+        try:
+            if self.recursive or os.path.dirname(abs_path) == self.root_dir:
+                if self._should_include_directory(abs_path):
+                    self.directories.add(abs_path)
+                    self._index_directory(abs_path)
+                    self._notify_file_change('directory_created', abs_path)
+                    self._schedule_save()
+        except Exception:
+            logger.exception("Error adding directory %s", dir_path)
+
+    def _index_file(self, file_path: str):
+        """将文件登记到所在目录的索引中"""
+        parent = os.path.dirname(file_path)
+        self._dir_to_files.setdefault(parent, set()).add(file_path)
+        self._index_directory(parent)
+
+    def _unindex_file(self, file_path: str):
+        """从所在目录的索引中移除文件"""
+        parent = os.path.dirname(file_path)
+        files = self._dir_to_files.get(parent)
+        if files is not None:
+            files.discard(file_path)
+            if not files:
+                del self._dir_to_files[parent]
+
+    def _index_directory(self, dir_path: str):
+        """将目录逐级挂到上级目录的子目录索引中，直到根目录或已登记的上级目录"""
+        while dir_path != self.root_dir:
+            parent = os.path.dirname(dir_path)
+            if parent == dir_path:
+                break
+            subdirs = self._dir_to_subdirs.setdefault(parent, set())
+            if dir_path in subdirs:
+                break
+            subdirs.add(dir_path)
+            dir_path = parent
+
+    def _pop_subtree(self, directory: str) -> Iterator[str]:
+        """按后序遍历目录子树并移除其子目录索引，子目录先于上级目录产出"""
+        stack = [(directory, False)]
+        while stack:
+            path, visited = stack.pop()
+            if visited:
+                yield path
+            else:
+                stack.append((path, True))
+                stack.extend((subdir, False) for subdir in self._dir_to_subdirs.pop(path, ()))
 
     def _remove_directory(self, directory):
-        """移除目录及其所有文件"""
-        directory = os.path.abspath(directory)
-        
-        # 移除该目录下的所有文件
-        files_to_remove = [f for f in self.files if f.startswith(directory)]
-        for file_path in files_to_remove:
-            del self.files[file_path]
-            self._notify_file_change('deleted', file_path)
-        
-        # 移除该目录下的所有子目录
-        subdirs_to_remove = [d for d in self.directories if d.startswith(directory)]
-        for subdir in subdirs_to_remove:
-            if subdir in self.directories:  # 检查目录是否存在
+        """移除目录及其所有文件
+
+        通过目录索引只遍历被删除的子树，不需要扫描全部文件；
+        通知按自底向上的顺序发出，目录中的文件和子目录先于目录本身。
+        """
+        for event_type, path in self._detach_directory(_abspath(directory)):
+            self._notify_file_change(event_type, path)
+        self._schedule_save()
+
+    def _detach_directory(self, directory: str) -> List[Tuple[str, str]]:
+        """从记录中移除目录子树，不发出通知
+
+        Returns:
+            按自底向上顺序排列的 (事件类型, 路径) 列表
+        """
+        siblings = self._dir_to_subdirs.get(os.path.dirname(directory))
+        if siblings is not None:
+            siblings.discard(directory)
+
+        events = []
+        for subdir in self._pop_subtree(directory):
+            for file_path in self._dir_to_files.pop(subdir, ()):
+                if self.files.pop(file_path, None) is not None:
+                    events.append(('deleted', file_path))
+            # 索引中可能包含只用于连接上级目录、并未被记录的目录
+            if subdir in self.directories:
                 self.directories.remove(subdir)
-                self._notify_file_change('directory_deleted', subdir)
-        
-        # 移除目录本身
-        if directory in self.directories:  # 检查目录是否存在
-            self.directories.remove(directory)
-            self._notify_file_change('directory_deleted', directory)
-        
-        self._save_data()
+                events.append(('directory_deleted', subdir))
+        return events
 
     def _notify_file_change(self, event_type: str, src_path: str, dst_path: str = None):
         """通知文件变更"""
         for callback in self.file_change_callbacks:
             try:
                 callback(event_type, src_path, dst_path)
-            except Exception as e:
-                print(f"Error in file change callback: {e}")
+            except Exception:
+                logger.exception("Error in file change callback")
+
+    def _create_observer(self):
+        """根据监控后端创建观察者"""
+        backend = self.backend
+        if backend == "auto":
+            backend = "polling" if _is_network_filesystem(self.root_dir) else "inotify"
+        if backend == "polling":
+            return PollingObserver(timeout=self.poll_interval)
+        return _native_observer_class()()
 
     def start_monitoring(self):
         """开始监控目录"""
         if not self.observer:
-            self.observer = Observer()
-            event_handler = FileEventHandler(self)
-            self.observer.schedule(event_handler, self.root_dir, recursive=self.recursive)
+            self.observer = self._create_observer()
+            self._event_handler = FileEventHandler(self)
+            self.observer.schedule(self._event_handler, self.root_dir, recursive=self.recursive)
             self.observer.start()
 
     def stop_monitoring(self):
@@ -300,6 +764,11 @@ class FileManager:
             self.observer.stop()
             self.observer.join()
             self.observer = None
+        if self._event_handler:
+            # 处理尚未合并完成的文件事件
+            self._event_handler.flush_pending()
+            self._event_handler = None
+        self.flush()
 
     def add_file_change_callback(self, callback):
         """添加文件变更回调函数"""
@@ -320,18 +789,21 @@ class FileManager:
         Returns:
             文件信息字典，如果文件不存在则返回None
         """
-        abs_path = os.path.abspath(file_path)
-        return self.files.get(abs_path)
+        # 记录的键都是规范化的绝对路径，调用方通常直接传入这样的路径，可以省去规范化
+        info = self.files.get(file_path)
+        if info is not None:
+            return info
+        return self.files.get(_abspath(file_path))
     
     def find_files(self, pattern: str = None, min_size: int = None, max_size: int = None):
         """查找文件"""
+        # 模式只编译一次，不必对每个文件调用 fnmatch
+        match = re.compile(fnmatch.translate(pattern), _PATTERN_FLAGS).match if pattern else None
+        basename = os.path.basename
         result = []
         for file_path, info in self.files.items():
-            if not os.path.exists(file_path):
-                continue
-
             # 检查文件名模式
-            if pattern and not fnmatch.fnmatch(os.path.basename(file_path), pattern):
+            if match and not match(basename(file_path)):
                 continue
             
             # 检查文件大小
@@ -340,96 +812,163 @@ class FileManager:
                 continue
             if max_size is not None and size > max_size:
                 continue
+
+            # 最后才检查文件是否存在，只对通过筛选的文件调用 stat
+            if not os.path.exists(file_path):
+                continue
             
             result.append(file_path)
         
         return sorted(result)  # 排序以确保结果顺序一致
 
-    def _match_pattern(self, file_path, pattern):
-        """检查文件路径是否匹配模式"""
-        return fnmatch.fnmatch(os.path.basename(file_path), pattern)
-
 class FileEventHandler(FileSystemEventHandler):
-    """文件事件处理器"""
+    """文件事件处理器
+
+    文件的创建和修改事件先合并，同一路径在 PENDING_DELAY 秒内的多次事件只处理一次；
+    目录事件和删除、移动事件立即处理。
+    """
+    PENDING_DELAY = 0.15
+
     def __init__(self, manager):
         self.manager = manager
         self._lock = threading.Lock()
+        self._pending: Dict[str, str] = {}  # {文件路径: 事件类型}
+        # 已从 _pending 取出、正在由 flush_pending 处理的路径 -> 所在批次，同样受 _pending_lock 保护
+        self._in_flight: Dict[str, Dict[str, str]] = {}
+        self._pending_lock = threading.Lock()
+        # 与保存相同，由同一个后台线程合并处理，不为每个事件创建计时器线程
+        self._flusher = AsyncSaver(self.flush_pending, self.PENDING_DELAY)
+
+    def _queue_file_event(self, path: str, event_type: str):
+        """记录待处理的文件事件，并重新开始计时"""
+        with self._pending_lock:
+            # 新建后紧接着的修改仍然作为创建事件通知
+            if self._pending.get(path) != 'created':
+                self._pending[path] = event_type
+        self._flusher.request()
+
+    def _discard_pending(self, path: str) -> Optional[str]:
+        """移除路径的待处理事件，返回其事件类型
+
+        正在处理中的事件同样会被移除并返回，flush_pending 不会再记录该路径。
+        """
+        with self._pending_lock:
+            event_type = self._pending.pop(path, None)
+            batch = self._in_flight.pop(path, None)
+            if event_type is None and batch is not None:
+                event_type = batch[path]
+            return event_type
+
+    def flush_pending(self):
+        """处理所有已合并的文件事件"""
+        self._flusher.cancel()
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            # 处理完成前保持可见，期间的删除和移动事件仍能找到这些路径
+            for path in pending:
+                self._in_flight[path] = pending
+
+        manager = self.manager
+        for path, event_type in pending.items():
+            result = None
+            if manager._should_include_file(path):
+                # 读取文件信息不需要持有锁，锁只保护对记录的修改
+                result = manager._stat_file(path)
+            with self._lock:
+                with self._pending_lock:
+                    # 读取后被删除或移动的路径已从 _in_flight 移除，不再记录
+                    if self._in_flight.get(path) is not pending:
+                        continue
+                    del self._in_flight[path]
+                if result is None:
+                    continue
+                manager._record_file(*result)
+            manager._schedule_save()
+            manager._notify_file_change(event_type, path)
 
     def on_created(self, event):
         """处理创建事件"""
+        manager = self.manager
+        if not event.is_directory:
+            if manager._should_include_file(event.src_path):
+                self._queue_file_event(event.src_path, 'created')
+            return
+
+        if not (manager.recursive or os.path.dirname(event.src_path) == manager.root_dir):
+            return
+        if not manager._should_include_directory(event.src_path):
+            return
         with self._lock:
-            if event.is_directory:
-                if self.manager.recursive or os.path.dirname(event.src_path) == self.manager.root_dir:
-                    if self.manager._should_include_directory(event.src_path):
-                        self.manager.directories.add(event.src_path)
-                        self.manager._notify_file_change('directory_created', event.src_path)
-                        self.manager._save_data()
-            else:
-                if self.manager._should_include_file(event.src_path):
-                    self.manager._add_file(event.src_path)
-                    self.manager._notify_file_change('created', event.src_path)
+            manager.directories.add(event.src_path)
+            manager._index_directory(event.src_path)
+        manager._notify_file_change('directory_created', event.src_path)
+        manager._schedule_save()
 
     def on_deleted(self, event):
         """处理删除事件"""
+        manager = self.manager
+        src_path = _abspath(event.src_path)
+        self._discard_pending(src_path)
+        logger.debug("收到删除事件: %s", src_path)
+        logger.debug("监控的目录列表: %s", manager.directories)
+
+        events = []
         with self._lock:
-            src_path = os.path.abspath(event.src_path)
-            print("\n收到删除事件:", src_path)  # 调试信息
-            print("监控的目录列表:", self.manager.directories)  # 调试信息
-            
             # 首先检查是否是被监控的目录
-            if src_path in self.manager.directories:
-                print("处理目录删除:", src_path)  # 调试信息
-                # 移除该目录下的所有文件
-                files_to_remove = [f for f in self.manager.files if f.startswith(src_path)]
-                for file_path in files_to_remove:
-                    del self.manager.files[file_path]
-                    self.manager._notify_file_change('deleted', file_path)
-                
-                # 移除该目录下的所有子目录
-                subdirs_to_remove = [d for d in self.manager.directories if d.startswith(src_path)]
-                for subdir in subdirs_to_remove:
-                    if subdir != src_path:  # 不要重复通知主目录的删除
-                        self.manager.directories.remove(subdir)
-                        self.manager._notify_file_change('directory_deleted', subdir)
-                
-                # 移除目录本身
-                self.manager.directories.remove(src_path)
-                self.manager._notify_file_change('directory_deleted', src_path)
-                self.manager._save_data()
+            if src_path in manager.directories:
+                logger.debug("处理目录删除: %s", src_path)
+                events = manager._detach_directory(src_path)
             # 然后检查是否是被监控的文件
-            elif src_path in self.manager.files:
-                print("处理文件删除:", src_path)  # 调试信息
-                del self.manager.files[src_path]
-                self.manager._notify_file_change('deleted', src_path)
-                self.manager._save_data()
+            elif src_path in manager.files:
+                logger.debug("处理文件删除: %s", src_path)
+                del manager.files[src_path]
+                manager._unindex_file(src_path)
+                events = [('deleted', src_path)]
+
+        for event_type, path in events:
+            manager._notify_file_change(event_type, path)
+        if events:
+            manager._schedule_save()
 
     def on_modified(self, event):
         """处理修改事件"""
         if not event.is_directory and self.manager._should_include_file(event.src_path):
-            self.manager._add_file(event.src_path)
-            self.manager._notify_file_change('modified', event.src_path)
+            self._queue_file_event(event.src_path, 'modified')
 
     def on_moved(self, event):
         """处理移动事件"""
-        with self._lock:
-            src_path = os.path.abspath(event.src_path)
-            dest_path = os.path.abspath(event.dest_path)
-            if src_path in self.manager.directories:
-                self.manager.directories.remove(src_path)
-                if self.manager.recursive or os.path.dirname(dest_path) == self.manager.root_dir:
-                    if self.manager._should_include_directory(dest_path):
-                        self.manager.directories.add(dest_path)
-                        self.manager._notify_file_change('directory_moved', src_path, dest_path)
-                    else:
-                        self.manager._notify_file_change('directory_deleted', src_path)
-                else:
-                    self.manager._notify_file_change('directory_deleted', src_path)
-                self.manager._save_data()
-            elif src_path in self.manager.files:
-                del self.manager.files[src_path]
-                if self.manager._should_include_file(dest_path):
-                    self.manager._add_file(dest_path)
-                    self.manager._notify_file_change('moved', src_path, dest_path)
-                else:
-                    self.manager._notify_file_change('deleted', src_path)
-                self.manager._save_data()
+        manager = self.manager
+        src_path = _abspath(event.src_path)
+        dest_path = _abspath(event.dest_path)
+        pending_type = self._discard_pending(src_path)
+
+        if pending_type and src_path not in manager.files:
+            # 尚未处理的新文件被移动（如编辑器先写临时文件再重命名），直接按目标路径处理
+            if manager._should_include_file(dest_path):
+                self._queue_file_event(dest_path, 'modified' if dest_path in manager.files else pending_type)
+        elif src_path in manager.directories:
+            keep = (manager.recursive or os.path.dirname(dest_path) == manager.root_dir) \
+                and manager._should_include_directory(dest_path)
+            with self._lock:
+                manager.directories.discard(src_path)
+                if keep:
+                    manager.directories.add(dest_path)
+                    manager._index_directory(dest_path)
+            if keep:
+                manager._notify_file_change('directory_moved', src_path, dest_path)
+            else:
+                manager._notify_file_change('directory_deleted', src_path)
+            manager._schedule_save()
+        elif src_path in manager.files:
+            # 先在锁外读取目标文件的信息
+            dest = manager._stat_file(dest_path) if manager._should_include_file(dest_path) else None
+            with self._lock:
+                if manager.files.pop(src_path, None) is not None:
+                    manager._unindex_file(src_path)
+                if dest:
+                    manager._record_file(*dest)
+            if dest:
+                manager._notify_file_change('moved', src_path, dest_path)
+            else:
+                manager._notify_file_change('deleted', src_path)
+            manager._schedule_save()
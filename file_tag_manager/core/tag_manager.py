@@ -1,11 +1,30 @@
 """标签管理核心模块"""
-from typing import List, Dict, Optional, Set
+from typing import Iterable, Iterator, List, Dict, Optional, Set
 import os
-import json
+import sys
+import logging
+import functools
 from dataclasses import dataclass, asdict
+from ..utils import atomic_write, dumps, load_file, loads
+from .config import DEFAULT_CONFIG_DIR
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+# Python 3.10 起 dataclass 支持 slots，大量标签时可省去每个实例的 __dict__
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@functools.lru_cache(maxsize=8192)
+def _norm(path: str) -> str:
+    """规范化文件路径
+
+    normpath 只做字符串处理，结果只取决于输入，批量打标签时同一路径会反复出现，因此缓存。
+    """
+    return os.path.normpath(path)
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class Tag:
     """标签"""
     name: str
@@ -14,41 +33,143 @@ class Tag:
 
 
 class TagManager:
-    """标签管理器"""
+    """标签管理器
+
+    数据保存为快照 tags.json 和追加写入的操作日志 tags.log，每次修改只向日志追加一行，
+    日志超过 COMPACT_THRESHOLD 字节时合并到快照中。
+    """
 
-    def __init__(self, config_dir: Optional[str] = None):
+    COMPACT_THRESHOLD = 1024 * 1024  # 日志合并阈值（字节）
+
+    def __init__(self, config_dir: Optional[str] = None, preloaded_data: Optional[Dict] = None):
         """初始化标签管理器
 
         Args:
             config_dir: 配置文件目录，默认为 ~/.file_tag_manager
+            preloaded_data: 已解析的 tags.json 内容，提供时跳过读取磁盘
         """
-        self.config_dir = config_dir if config_dir else os.path.expanduser("~/.file_tag_manager")
+        self.config_dir = config_dir or DEFAULT_CONFIG_DIR
         if not os.path.exists(self.config_dir):
             os.makedirs(self.config_dir)
 
         self.tags_file = os.path.join(self.config_dir, "tags.json")
+        self.log_file = os.path.join(self.config_dir, "tags.log")
+        self._log_size = 0
         self.tags: Dict[str, Tag] = {}  # tag_id -> Tag
         self.file_tags: Dict[str, Set[str]] = {}  # file_path -> set(tag_id)
-        self._load_data()
+        self._tag_to_files: Dict[str, Set[str]] = {}  # tag_id -> set(file_path)，由 file_tags 派生
+        self._children: Dict[str, Set[str]] = {}  # tag_id -> set(子标签ID)，由 tags 派生
+        self._load_data(preloaded_data)
+
+    def _load_data(self, data: Optional[Dict] = None) -> None:
+        """从快照加载标签数据，再重放操作日志
 
-    def _load_data(self) -> None:
-        """从文件加载标签数据"""
-        if not os.path.exists(self.tags_file):
+        Args:
+            data: 已解析的 tags.json 内容，为 None 时从磁盘读取
+        """
+        if data is None:
+            try:
+                # 空文件视为没有快照
+                data = load_file(self.tags_file) if os.path.getsize(self.tags_file) else {}
+            except FileNotFoundError:
+                data = {}
+
+        # 标签ID会在标签、父标签和文件标签中反复出现，文件路径也会出现在 FileManager 中，
+        # 驻留后共享同一个字符串对象
+        intern = sys.intern
+        self.tags = {}
+        self._children = {}
+        for tag_id, tag_data in data.get('tags', {}).items():
+            tag = Tag(**tag_data)
+            tag_id = intern(tag_id)
+            if tag.parent:
+                tag.parent = intern(tag.parent)
+                self._children.setdefault(tag.parent, set()).add(tag_id)
+            self.tags[tag_id] = tag
+        self.file_tags = {
+            intern(file_path): {intern(tag_id) for tag_id in tag_ids}
+            for file_path, tag_ids in data.get('file_tags', {}).items()
+        }
+        self._tag_to_files = {}
+        for file_path, tag_ids in self.file_tags.items():
+            for tag_id in tag_ids:
+                self._tag_to_files.setdefault(tag_id, set()).add(file_path)
+        self._replay_log()
+
+    def _replay_log(self) -> None:
+        """按顺序重放操作日志中的修改"""
+        try:
+            with open(self.log_file, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            self._log_size = 0
             return
 
-        with open(self.tags_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            self.tags = {
-                tag_id: Tag(**tag_data)
-                for tag_id, tag_data in data.get('tags', {}).items()
-            }
-            self.file_tags = {
-                file_path: set(tag_ids)
-                for file_path, tag_ids in data.get('file_tags', {}).items()
-            }
+        # 写入过程中崩溃可能留下没有换行结尾的最后一行，截掉它，
+        # 否则之后追加的记录会接在这一行后面而一起被丢弃
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            logger.warning("丢弃不完整的标签日志记录: %r", content[end:])
+            with open(self.log_file, 'r+b') as f:
+                f.truncate(end)
+            content = content[:end]
+
+        self._log_size = len(content)
+        intern = sys.intern
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except ValueError:
+                logger.warning("忽略损坏的标签日志记录: %r", line)
+                continue
+
+            op = record.get('op')
+            if op == 'create_tag':
+                parent = record.get('parent')
+                self._apply_create_tag(
+                    intern(record['id']),
+                    Tag(name=record['name'], description=record['description'],
+                        parent=intern(parent) if parent else None),
+                )
+            elif op == 'remove_tag':
+                if record['id'] in self.tags:
+                    self._apply_remove_tag(record['id'])
+            elif op == 'add_file_tags':
+                tag_ids = [intern(tag_id) for tag_id in record['tags'] if tag_id in self.tags]
+                if tag_ids:
+                    self._apply_add_file_tags(record['path'], tag_ids)
+            elif op == 'remove_file_tags':
+                self._apply_remove_file_tags(record['path'], record['tags'])
+            else:
+                logger.warning("未知的标签日志操作: %s", op)
+
+    def _append_log(self, record: Dict) -> None:
+        """向操作日志追加一条记录，日志过大时合并到快照
+
+        Args:
+            record: 操作记录，op 字段为操作类型
+        """
+        line = dumps(record) + b'\n'
+        with open(self.log_file, 'ab') as f:
+            f.write(line)
+        self._log_size += len(line)
+        if self._log_size > self.COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self) -> None:
+        """将当前数据写入快照 tags.json 并清空操作日志"""
+        self._save_data()
+        # 日志中的操作都是幂等的，即使删除日志前崩溃，重放后结果也不变
+        try:
+            os.remove(self.log_file)
+        except FileNotFoundError:
+            pass
+        self._log_size = 0
 
     def _save_data(self) -> None:
-        """保存标签数据到文件"""
+        """保存标签数据快照到文件"""
         data = {
             'tags': {
                 tag_id: asdict(tag)
@@ -59,8 +180,7 @@ class TagManager:
                 for file_path, tag_ids in self.file_tags.items()
             }
         }
-        with open(self.tags_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        atomic_write(self.tags_file, dumps(data))
 
     def create_tag(self, name: str, description: str = "", parent: Optional[str] = None) -> str:
         """创建新标签
@@ -83,10 +203,23 @@ class TagManager:
             tag_id = f"{name.lower().replace(' ', '-')}-{suffix}"
             suffix += 1
 
-        self.tags[tag_id] = Tag(name=name, description=description, parent=parent)
-        self._save_data()
+        tag_id = sys.intern(tag_id)
+        self._apply_create_tag(tag_id, Tag(name=name, description=description, parent=parent))
+        self._append_log({
+            'op': 'create_tag',
+            'id': tag_id,
+            'name': name,
+            'description': description,
+            'parent': parent,
+        })
         return tag_id
 
+    def _apply_create_tag(self, tag_id: str, tag: Tag) -> None:
+        """在内存中添加标签"""
+        self.tags[tag_id] = tag
+        if tag.parent:
+            self._children.setdefault(tag.parent, set()).add(tag_id)
+
     def remove_tag(self, tag_id: str) -> None:
         """删除标签及其所有子标签
 
@@ -96,26 +229,34 @@ class TagManager:
         if tag_id not in self.tags:
             raise ValueError(f"标签 {tag_id} 不存在")
 
-        # 找到所有子标签
-        child_tags = []
-        for tid, tag in self.tags.items():
-            if tag.parent == tag_id:
-                child_tags.append(tid)
-
-        # 递归删除子标签
-        for child_id in child_tags:
-            self.remove_tag(child_id)
-
-        # 从所有文件中移除此标签
-        for file_path in list(self.file_tags.keys()):
-            if tag_id in self.file_tags[file_path]:
-                self.file_tags[file_path].remove(tag_id)
-                if not self.file_tags[file_path]:
+        self._apply_remove_tag(tag_id)
+        self._append_log({'op': 'remove_tag', 'id': tag_id})
+
+    def _apply_remove_tag(self, tag_id: str) -> None:
+        """在内存中删除标签及其所有子标签"""
+        # 通过子标签索引收集整棵子树，不需要递归
+        to_delete = []
+        stack = [tag_id]
+        while stack:
+            current = stack.pop()
+            to_delete.append(current)
+            stack.extend(self._children.pop(current, ()))
+
+        parent = self.tags[tag_id].parent
+        siblings = self._children.get(parent)
+        if siblings is not None:
+            siblings.discard(tag_id)
+            if not siblings:
+                del self._children[parent]
+
+        for current in to_delete:
+            # 通过倒排索引只处理带有此标签的文件
+            for file_path in self._tag_to_files.pop(current, ()):
+                file_tag_ids = self.file_tags[file_path]
+                file_tag_ids.discard(current)
+                if not file_tag_ids:
                     del self.file_tags[file_path]
-
-        # 删除标签本身
-        del self.tags[tag_id]
-        self._save_data()
+            self.tags.pop(current, None)
 
     def get_tag(self, tag_id: str) -> Optional[Tag]:
         """获取标签信息
@@ -128,6 +269,18 @@ class TagManager:
         """
         return self.tags.get(tag_id)
 
+    def get_tags(self, tag_ids: Iterable[str]) -> Dict[str, Tag]:
+        """批量获取标签信息
+
+        Args:
+            tag_ids: 标签ID列表
+
+        Returns:
+            存在的标签字典，key 为标签ID，value 为标签信息；不存在的标签会被忽略
+        """
+        tags = self.tags
+        return {tag_id: tags[tag_id] for tag_id in tag_ids if tag_id in tags}
+
     def get_all_tags(self) -> Dict[str, Tag]:
         """获取所有标签
 
@@ -143,14 +296,36 @@ class TagManager:
             file_path: 文件路径
             tag_id: 标签ID
         """
-        if tag_id not in self.tags:
-            raise ValueError(f"标签 {tag_id} 不存在")
+        self.add_tags_to_file(file_path, [tag_id])
 
-        file_path = os.path.normpath(file_path)
-        if file_path not in self.file_tags:
-            self.file_tags[file_path] = set()
-        self.file_tags[file_path].add(tag_id)
-        self._save_data()
+    def add_tags_to_file(self, file_path: str, tag_ids: Iterable[str]) -> None:
+        """为文件批量添加标签，所有修改只保存一次
+
+        Args:
+            file_path: 文件路径
+            tag_ids: 标签ID列表
+
+        Raises:
+            ValueError: 任一标签不存在时抛出，此时不做任何修改
+        """
+        tag_ids = list(tag_ids)
+        for tag_id in tag_ids:
+            if tag_id not in self.tags:
+                raise ValueError(f"标签 {tag_id} 不存在")
+        if not tag_ids:
+            return
+
+        file_path = _norm(file_path)
+        self._apply_add_file_tags(file_path, tag_ids)
+        self._append_log({'op': 'add_file_tags', 'path': file_path, 'tags': tag_ids})
+
+    def _apply_add_file_tags(self, file_path: str, tag_ids: List[str]) -> None:
+        """在内存中为文件添加标签"""
+        # 驻留路径字符串，与 FileManager 中相同的文件路径共享同一个对象
+        file_path = sys.intern(file_path)
+        self.file_tags.setdefault(file_path, set()).update(tag_ids)
+        for tag_id in tag_ids:
+            self._tag_to_files.setdefault(tag_id, set()).add(file_path)
 
     def remove_tag_from_file(self, file_path: str, tag_id: str) -> None:
         """从文件移除标签
@@ -159,12 +334,41 @@ class TagManager:
             file_path: 文件路径
             tag_id: 标签ID
         """
-        file_path = os.path.normpath(file_path)
-        if file_path in self.file_tags and tag_id in self.file_tags[file_path]:
-            self.file_tags[file_path].remove(tag_id)
-            if not self.file_tags[file_path]:
+        self.remove_tags_from_file(file_path, [tag_id])
+
+    def remove_tags_from_file(self, file_path: str, tag_ids: Iterable[str]) -> None:
+        """从文件批量移除标签，所有修改只保存一次
+
+        Args:
+            file_path: 文件路径
+            tag_ids: 标签ID列表
+        """
+        file_path = _norm(file_path)
+        removed = self._apply_remove_file_tags(file_path, tag_ids)
+        if removed:
+            self._append_log({'op': 'remove_file_tags', 'path': file_path, 'tags': sorted(removed)})
+
+    def _apply_remove_file_tags(self, file_path: str, tag_ids: Iterable[str]) -> Set[str]:
+        """在内存中移除文件的标签
+
+        Returns:
+            实际移除的标签ID集合
+        """
+        file_tag_ids = self.file_tags.get(file_path)
+        if not file_tag_ids:
+            return set()
+
+        removed = file_tag_ids.intersection(tag_ids)
+        if removed:
+            file_tag_ids -= removed
+            if not file_tag_ids:
                 del self.file_tags[file_path]
-            self._save_data()
+            for tag_id in removed:
+                tagged_files = self._tag_to_files[tag_id]
+                tagged_files.discard(file_path)
+                if not tagged_files:
+                    del self._tag_to_files[tag_id]
+        return removed
 
     def get_file_tags(self, file_path: str) -> Set[str]:
         """获取文件的所有标签
@@ -175,32 +379,63 @@ class TagManager:
         Returns:
             文件的标签ID集合
         """
-        file_path = os.path.normpath(file_path)
+        file_path = _norm(file_path)
         return self.file_tags.get(file_path, set()).copy()
 
-    def find_files_by_tags(self, tag_ids: List[str], match_all: bool = False) -> List[str]:
+    def find_files_by_tags(self, tag_ids: List[str], match_all: bool = False,
+                           under: Optional[str] = None) -> List[str]:
         """查找包含指定标签的文件
 
         Args:
             tag_ids: 标签ID列表
             match_all: 是否要求文件包含所有指定的标签
+            under: 只返回位于该目录下的文件，为 None 时不限制
 
         Returns:
             匹配的文件路径列表
         """
-        if not tag_ids:
-            return []
+        return list(self.iter_files_by_tags(tag_ids, match_all, under))
 
-        for tag_id in tag_ids:
+    def iter_files_by_tags(self, tag_ids: Iterable[str], match_all: bool = False,
+                           under: Optional[str] = None) -> Iterator[str]:
+        """按路径顺序逐个返回包含指定标签的文件
+
+        标签会在调用时立即校验，调用方可以边迭代边输出结果。
+
+        Args:
+            tag_ids: 标签ID列表
+            match_all: 是否要求文件包含所有指定的标签
+            under: 只返回位于该目录下的文件，为 None 时不限制
+
+        Returns:
+            匹配的文件路径迭代器
+        """
+        wanted = set(tag_ids)
+        if not wanted:
+            return iter(())
+
+        for tag_id in wanted:
             if tag_id not in self.tags:
                 raise ValueError(f"标签 {tag_id} 不存在")
 
-        result = []
-        for file_path, file_tag_ids in self.file_tags.items():
-            if match_all:
-                if all(tag_id in file_tag_ids for tag_id in tag_ids):
-                    result.append(os.path.normpath(file_path))
-            else:
-                if any(tag_id in file_tag_ids for tag_id in tag_ids):
-                    result.append(os.path.normpath(file_path))
-        return sorted(result)
+        file_sets = [self._tag_to_files.get(tag_id, set()) for tag_id in wanted]
+        if match_all:
+            # 从最小的集合开始求交集，结果为空时提前结束
+            file_sets.sort(key=len)
+            matched = set(file_sets[0])
+            for file_set in file_sets[1:]:
+                if not matched:
+                    break
+                matched &= file_set
+        else:
+            matched = set().union(*file_sets)
+
+        if under is not None:
+            # 只在标签匹配的结果上做前缀比较，不需要遍历所有文件
+            under = _norm(under)
+            prefix = os.path.join(under, '')
+            matched = [
+                file_path for file_path in matched
+                if file_path.startswith(prefix) or file_path == under
+            ]
+        return iter(sorted(matched))
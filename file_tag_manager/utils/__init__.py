@@ -0,0 +1,7 @@
+"""通用工具模块"""
+
+from .fileio import atomic_write
+from .jsonio import dumps, loads, load_file
+from .saver import AsyncSaver
+
+__all__ = ['AsyncSaver', 'atomic_write', 'dumps', 'loads', 'load_file']
@@ -0,0 +1,33 @@
+"""文件写入工具"""
+import os
+import threading
+
+# Windows 上需要 O_BINARY，否则会转换换行符
+_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+def atomic_write(path: str, data: bytes) -> None:
+    """原子地写入文件
+
+    先写入同目录下的临时文件并同步到磁盘，再替换目标文件，
+    写入过程中出错或进程崩溃都不会留下不完整的文件。
+
+    Args:
+        path: 目标文件路径
+        data: 要写入的数据
+    """
+    # 临时文件名包含进程和线程 ID，避免并发保存时互相覆盖
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        fd = os.open(tmp_path, _OPEN_FLAGS, 0o666)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,61 @@
+"""JSON 读写工具"""
+import json
+import mmap
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+# 超过该大小的文件通过内存映射交给 orjson 解析，省去读入 bytes 的复制
+_MMAP_THRESHOLD = 1024 * 1024
+
+
+def loads(data: bytes) -> Any:
+    """解析 JSON 数据，安装了 orjson 时使用 orjson 加速
+
+    Args:
+        data: UTF-8 编码的 JSON 数据
+
+    Returns:
+        解析后的对象
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """将对象编码为不含空白的紧凑 JSON 数据，安装了 orjson 时使用 orjson 加速
+
+    非 ASCII 字符（如中文标签名）直接以 UTF-8 输出，不转义为 \\uXXXX。
+
+    Args:
+        obj: 要编码的对象
+
+    Returns:
+        UTF-8 编码的 JSON 数据
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load_file(path: str) -> Any:
+    """读取并解析 JSON 文件
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        解析后的对象
+    """
+    with open(path, 'rb') as f:
+        # 空文件无法映射，小文件直接读取更快；标准库 json 不接受 memoryview
+        if orjson is not None and os.fstat(f.fileno()).st_size >= _MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    return orjson.loads(view)
+        return loads(f.read())
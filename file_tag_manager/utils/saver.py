@@ -0,0 +1,62 @@
+"""后台保存工具"""
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSaver:
+    """在后台线程中合并执行保存操作
+
+    调用 request() 后立即返回，保存在 delay 秒内没有新请求时由后台线程执行一次。
+    后台线程在没有待执行的请求时退出，下次请求时重新启动，
+    因此空闲时不占用线程，进程退出前也会等待尚未执行的保存完成。
+    """
+
+    def __init__(self, save: Callable[[], None], delay: float = 0.0):
+        """初始化后台保存器
+
+        Args:
+            save: 执行保存的函数
+            delay: 最后一次请求之后等待的秒数
+        """
+        self._save = save
+        self._delay = delay
+        self._condition = threading.Condition()
+        self._deadline: Optional[float] = None  # 计划执行保存的时间，None 表示没有待执行的请求
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self) -> None:
+        """请求保存，已有待执行的请求时推迟到 delay 秒之后"""
+        with self._condition:
+            self._deadline = time.monotonic() + self._delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="AsyncSaver")
+                self._thread.start()
+
+    def cancel(self) -> None:
+        """取消尚未执行的保存请求"""
+        with self._condition:
+            self._deadline = None
+            self._condition.notify()
+
+    def _run(self) -> None:
+        """后台线程：等待请求到期后执行保存，没有请求时退出"""
+        while True:
+            with self._condition:
+                while self._deadline is not None:
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._deadline is None:
+                    self._thread = None
+                    return
+                self._deadline = None
+
+            try:
+                self._save()
+            except Exception:
+                logger.exception("Error in background save")
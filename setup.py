@@ -17,6 +17,9 @@ setup(
         "pytest>=7.3.1",
         "click>=8.1.0",
     ],
+    extras_require={
+        'speedups': ["orjson>=3.0"],
+    },
     entry_points={
         'console_scripts': [
             'ftm=file_tag_manager.cli:cli',
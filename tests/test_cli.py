@@ -84,11 +84,7 @@ def test_directory_monitoring(runner, test_dir, ctx, config_dir):
     sub_dir = os.path.join(test_dir, "subdir")
     os.makedirs(sub_dir)
 
-    # 等待文件系统事件
-    import time
-    time.sleep(1)
-
-    # 列出监控的目录
+    # 列出监控的目录（每个命令都会重新扫描目录）
     result = runner.invoke(cli, ['list-directories', '--config-dir', config_dir], obj=ctx)
     assert result.exit_code == 0, f"列出目录命令失败: {result.output}"
     print(f"\n创建目录后的目录列表:\n{result.output}")
@@ -97,9 +93,6 @@ def test_directory_monitoring(runner, test_dir, ctx, config_dir):
     # 删除子目录
     shutil.rmtree(sub_dir)
 
-    # 等待文件系统事件
-    time.sleep(1)
-
     # 再次列出监控的目录
     result = runner.invoke(cli, ['list-directories', '--config-dir', config_dir], obj=ctx)
     assert result.exit_code == 0, f"列出目录命令失败: {result.output}"
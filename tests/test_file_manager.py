@@ -1,46 +1,63 @@
 """文件管理器测试"""
 import os
+import sys
 import time
 import shutil
+import threading
 import pytest
+from pathlib import Path
 from file_tag_manager.core.file_manager import FileManager
 
 @pytest.fixture
 def temp_dir(tmp_path):
-    """创建临时测试目录"""
+    """创建临时测试目录
+
+    返回规范化的绝对路径，测试中由它拼接的路径可以直接与管理器记录的路径比较。
+    """
     test_dir = tmp_path / "test_dir"
     test_dir.mkdir()
-    yield str(test_dir)
-    # 清理临时目录
-    if test_dir.exists():
-        shutil.rmtree(test_dir)
+    return os.path.abspath(test_dir)
 
 @pytest.fixture
 def config_dir(tmp_path):
     """创建临时配置目录"""
     config_dir = tmp_path / "config"
     config_dir.mkdir()
-    yield str(config_dir)
-    # 清理临时目录
-    if config_dir.exists():
-        shutil.rmtree(config_dir)
+    return str(config_dir)
 
 @pytest.fixture
 def file_manager(temp_dir, config_dir):
     """创建文件管理器实例"""
     manager = FileManager(temp_dir, config_dir=config_dir, include_patterns=["*.txt", "*.py", "*.doc"])
     yield manager
-    # 停止监控
-    if manager.observer:
-        manager.observer.stop()
-        manager.observer.join()
+    # 停止监控并处理尚未合并完成的事件、写入尚未保存的修改，
+    # 避免后台线程在测试结束后才回调或写入
+    observer = manager.observer
+    try:
+        manager.stop_monitoring()
+    finally:
+        # stop_monitoring 出错时仍然停止观察者线程，但不长时间等待
+        if observer and observer.is_alive():
+            observer.stop()
+            observer.join(timeout=0.1)
 
 def create_test_file(path, content="test"):
-    """创建测试文件"""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        f.write(content)
-    time.sleep(0.1)  # 等待文件系统更新
+    """创建测试文件，父目录不存在时才创建"""
+    path = Path(path)
+    try:
+        path.write_text(content)
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+def wait_for(predicate, timeout=2.0, interval=0.005):
+    """轮询等待条件成立，超时返回 False"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
 
 def test_scan_directory(temp_dir, file_manager):
     """测试目录扫描"""
@@ -52,23 +69,37 @@ def test_scan_directory(temp_dir, file_manager):
     
     # 重新扫描目录
     file_manager._scan_directory(temp_dir)
-    time.sleep(0.1)  # 等待扫描完成
     
     # 验证文件被正确扫描
-    assert os.path.abspath(file1) in file_manager.files
-    assert os.path.abspath(file2) in file_manager.files
+    assert file1 in file_manager.files
+    assert file2 in file_manager.files
     
     # 验证文件信息
     for file_path in [file1, file2]:
-        abs_path = os.path.abspath(file_path)
-        info = file_manager.files[abs_path]
+        info = file_manager.files[file_path]
         assert 'size' in info
         assert 'created_time' in info
         assert 'modified_time' in info
         assert 'relative_path' in info
         assert info['size'] == len("test")
 
-@pytest.mark.skip("暂时跳过不稳定的文件监控测试")
+def test_parallel_scan(temp_dir, file_manager):
+    """测试子目录较多时并发扫描的结果与逐个扫描一致"""
+    expected = set()
+    for i in range(file_manager.PARALLEL_SCAN_THRESHOLD + 2):
+        # 根目录下的子目录，以及单个顶层目录下展开的深层子目录
+        for parent in (temp_dir, os.path.join(temp_dir, "deep", "nested")):
+            file_path = os.path.join(parent, f"dir{i}", "sub", f"file{i}.txt")
+            os.makedirs(os.path.dirname(file_path))
+            with open(file_path, "w") as f:
+                f.write("test")
+            expected.add(file_path)
+
+    file_manager._scan_directory(temp_dir)
+    assert set(file_manager.files) == expected
+    assert os.path.join(temp_dir, "dir0", "sub") in file_manager.directories
+    assert os.path.join(temp_dir, "deep", "nested", "dir0", "sub") in file_manager.directories
+
 def test_file_monitoring(temp_dir, file_manager):
     """测试文件监控"""
     file_manager.start_monitoring()
@@ -76,18 +107,15 @@ def test_file_monitoring(temp_dir, file_manager):
         # 创建新文件
         file_path = os.path.join(temp_dir, "monitored_file.txt")
         create_test_file(file_path)
-        time.sleep(1)  # 等待文件系统事件
-        assert os.path.abspath(file_path) in file_manager.files
+        assert wait_for(lambda: file_path in file_manager.files)
         
         # 修改文件
         create_test_file(file_path, "new content")
-        time.sleep(1)
-        assert file_manager.files[os.path.abspath(file_path)]['size'] == len("new content")
+        assert wait_for(lambda: file_manager.files.get(file_path, {}).get('size') == len("new content"))
         
         # 删除文件
         os.remove(file_path)
-        time.sleep(1)
-        assert os.path.abspath(file_path) not in file_manager.files
+        assert wait_for(lambda: file_path not in file_manager.files)
     finally:
         file_manager.stop_monitoring()
 
@@ -99,18 +127,33 @@ def test_get_file_info(temp_dir, file_manager):
     
     # 重新扫描目录
     file_manager._scan_directory(temp_dir)
-    time.sleep(0.1)  # 等待扫描完成
     
     # 获取并验证文件信息
-    abs_path = os.path.abspath(file_path)
-    info = file_manager.get_file_info(abs_path)
+    info = file_manager.get_file_info(file_path)
     assert info is not None
     assert info['size'] == len("test")
-    assert info['relative_path'] == os.path.relpath(file_path, temp_dir)
+    assert info['relative_path'] == "test_file.txt"
     
     # 测试不存在的文件
     assert file_manager.get_file_info("nonexistent.txt") is None
 
+def test_reset(temp_dir, file_manager):
+    """测试清空记录后重新扫描"""
+    file_path = os.path.join(temp_dir, "dir", "file.txt")
+    create_test_file(file_path)
+    file_manager._scan_directory(temp_dir)
+    file_manager.add_file_change_callback(lambda *args: None)
+    file_manager.start_monitoring()
+
+    file_manager.reset()
+    assert file_manager.observer is None
+    assert not file_manager.files
+    assert not file_manager.directories
+    assert not file_manager.file_change_callbacks
+
+    file_manager._scan_directory(temp_dir)
+    assert file_path in file_manager.files
+
 def test_find_files(temp_dir, file_manager):
     """测试文件查找"""
     # 创建测试文件
@@ -127,12 +170,11 @@ def test_find_files(temp_dir, file_manager):
     
     # 重新扫描目录
     file_manager._scan_directory(temp_dir)
-    time.sleep(0.1)  # 等待扫描完成
     
     # 按文件名模式查找
     txt_files = file_manager.find_files(pattern="*.txt")
     assert len(txt_files) == 3
-    assert all(os.path.abspath(f).endswith('.txt') for f in txt_files)
+    assert all(f.endswith('.txt') for f in txt_files)
 
     # 按大小范围查找
     small_files = file_manager.find_files(max_size=2)  # 调整大小限制为2字节
@@ -163,6 +205,31 @@ def test_file_whitelist(file_manager, temp_dir):
     assert md_file not in file_manager.files
     assert doc_file in file_manager.files
 
+def test_pattern_cache(file_manager, temp_dir):
+    """测试修改模式后缓存的匹配结果失效"""
+    md_file = os.path.join(temp_dir, "test.md")
+    assert not file_manager._should_include_file(md_file)
+
+    file_manager.include_patterns.add("*.md")
+    file_manager._recompile_patterns()
+    assert file_manager._should_include_file(md_file)
+
+def test_directory_exclude_patterns(temp_dir, config_dir):
+    """测试目录模式只去掉完整的 /* 后缀"""
+    manager = FileManager(temp_dir, config_dir=config_dir, exclude_patterns=["!build*", "!docs/**"])
+    manager.include_patterns = {"*.py"}
+    manager._recompile_patterns()
+    assert not manager._should_include_directory(os.path.join(temp_dir, "build2"))
+    assert not manager._should_include_directory(os.path.join(temp_dir, "docs"))
+    assert manager._should_include_directory(os.path.join(temp_dir, "src"))
+
+    # 包含模式中连续的 /**/* 后缀全部去掉，被排除的 src 仍因包含模式而保留
+    manager.include_patterns = {"src/**/*"}
+    manager.exclude_patterns = {"!src/*"}
+    manager._recompile_patterns()
+    manager.clear_pattern_cache()
+    assert manager._should_include_directory(os.path.join(temp_dir, "src"))
+
 def test_directory_monitoring(file_manager, temp_dir):
     """测试目录监控功能"""
     # 创建测试目录
@@ -190,6 +257,22 @@ def test_directory_monitoring(file_manager, temp_dir):
     assert sub_dir not in file_manager.directories
     assert new_dir in file_manager.directories
 
+def test_remove_directory_subtree(file_manager, temp_dir):
+    """测试删除目录只移除其子树中的文件和目录"""
+    nested_file = os.path.join(temp_dir, "a", "b", "c", "nested.txt")
+    sibling_file = os.path.join(temp_dir, "a", "bc", "sibling.txt")
+    create_test_file(nested_file)
+    create_test_file(sibling_file)
+    file_manager._scan_directory(temp_dir)
+
+    file_manager._remove_directory(os.path.join(temp_dir, "a", "b"))
+    assert nested_file not in file_manager.files
+    assert os.path.join(temp_dir, "a", "b", "c") not in file_manager.directories
+    assert os.path.join(temp_dir, "a", "b") not in file_manager.directories
+    # 名称前缀相同的兄弟目录不受影响
+    assert sibling_file in file_manager.files
+    assert os.path.join(temp_dir, "a", "bc") in file_manager.directories
+
 def test_file_monitoring_with_whitelist(file_manager, temp_dir):
     """测试带白名单的文件监控"""
     # 启动监控
@@ -199,37 +282,42 @@ def test_file_monitoring_with_whitelist(file_manager, temp_dir):
     txt_file = os.path.join(temp_dir, "test.txt")
     with open(txt_file, "w") as f:
         f.write("test")
-    time.sleep(1)  # 等待文件系统事件
-    assert txt_file in file_manager.files
+    assert wait_for(lambda: txt_file in file_manager.files)
 
-    # 创建不符合白名单的文件
+    # 创建不符合白名单的文件，随后创建的文件被处理时它的事件也已经处理过
     md_file = os.path.join(temp_dir, "test.md")
     with open(md_file, "w") as f:
         f.write("test")
-    time.sleep(1)  # 等待文件系统事件
+    marker_file = os.path.join(temp_dir, "marker.txt")
+    create_test_file(marker_file)
+    assert wait_for(lambda: marker_file in file_manager.files)
     assert md_file not in file_manager.files
 
     # 移动文件（符合白名单 -> 不符合白名单）
     new_file = os.path.join(temp_dir, "test2.md")
     os.rename(txt_file, new_file)
-    time.sleep(1)  # 等待文件系统事件
-    assert txt_file not in file_manager.files
+    assert wait_for(lambda: txt_file not in file_manager.files)
     assert new_file not in file_manager.files
 
 def test_callback_with_directories(file_manager, temp_dir):
     """测试目录变更的回调函数"""
     events = []
+    created = threading.Event()
+    deleted = threading.Event()
     def callback(event_type, src_path, dst_path=None):
         events.append((event_type, src_path, dst_path))
+        if event_type == 'directory_created' and src_path == sub_dir:
+            created.set()
+        elif 'deleted' in event_type and src_path.startswith(sub_dir):
+            deleted.set()
 
+    sub_dir = os.path.join(temp_dir, "subdir")
     file_manager.add_file_change_callback(callback)
     file_manager.start_monitoring()
-    time.sleep(0.1)  # 等待监控启动
 
     # 测试目录创建
-    sub_dir = os.path.join(temp_dir, "subdir")
     os.makedirs(sub_dir)
-    time.sleep(2)  # 等待文件系统事件
+    created.wait(timeout=2)  # 等待文件系统事件
     print("\n创建目录后的事件:", events)  # 调试信息
     assert any(event[0] == 'directory_created' and event[1] == sub_dir for event in events)
     print("\n目录是否在监控列表中:", sub_dir in file_manager.directories)  # 调试信息
@@ -238,9 +326,119 @@ def test_callback_with_directories(file_manager, temp_dir):
 
     # 测试目录删除
     shutil.rmtree(sub_dir)
-    time.sleep(2)  # 等待文件系统事件
+    deleted.wait(timeout=2)  # 等待文件系统事件
     print("\n删除目录后的事件:", events)  # 调试信息
     # 检查是否收到任何与删除相关的事件
     delete_events = [event for event in events if 'deleted' in event[0] and event[1].startswith(sub_dir)]
     print("\n删除相关事件:", delete_events)  # 调试信息
     assert len(delete_events) > 0, "应该至少收到一个删除事件"
+
+def test_monitor_backend(temp_dir, config_dir):
+    """测试监控后端的选择和保存"""
+    from watchdog.observers.polling import PollingObserver
+
+    with pytest.raises(ValueError):
+        FileManager(temp_dir, config_dir=config_dir, backend="unknown")
+
+    manager = FileManager(temp_dir, config_dir=config_dir, backend="polling", poll_interval=5)
+    assert isinstance(manager._create_observer(), PollingObserver)
+
+    if sys.platform.startswith('linux'):
+        from watchdog.observers.inotify import InotifyObserver
+        manager.backend = "inotify"
+        assert isinstance(manager._create_observer(), InotifyObserver)
+
+    # 未指定时沿用保存的配置
+    reloaded = FileManager(temp_dir, config_dir=config_dir)
+    assert reloaded.backend == "polling"
+    assert reloaded.poll_interval == 5
+
+    # 显式指定 auto 时覆盖保存的配置
+    explicit = FileManager(temp_dir, config_dir=config_dir, backend="auto")
+    assert explicit.backend == "auto"
+    assert FileManager(temp_dir, config_dir=config_dir).backend == "auto"
+
+def test_coalesce_file_events(file_manager, temp_dir):
+    """测试同一文件的多次修改事件只处理一次"""
+    from watchdog.events import FileCreatedEvent, FileModifiedEvent
+    from file_tag_manager.core.file_manager import FileEventHandler
+
+    events = []
+    file_manager.add_file_change_callback(lambda *args: events.append(args[:2]))
+    handler = FileEventHandler(file_manager)
+
+    file_path = os.path.join(temp_dir, "burst.txt")
+    create_test_file(file_path)
+    handler.on_created(FileCreatedEvent(file_path))
+    for _ in range(5):
+        handler.on_modified(FileModifiedEvent(file_path))
+    assert file_path not in file_manager.files
+
+    handler.flush_pending()
+    assert file_path in file_manager.files
+    assert events == [('created', file_path)]
+
+def test_move_during_flush(file_manager, temp_dir):
+    """测试处理合并事件期间临时文件被重命名时记录目标文件"""
+    from watchdog.events import FileCreatedEvent, FileMovedEvent
+    from file_tag_manager.core.file_manager import FileEventHandler
+
+    handler = FileEventHandler(file_manager)
+    tmp_path = os.path.join(temp_dir, "save.txt.tmp.txt")
+    dest_path = os.path.join(temp_dir, "save.txt")
+    create_test_file(tmp_path)
+    handler.on_created(FileCreatedEvent(tmp_path))
+
+    stat_file = file_manager._stat_file
+    def rename_then_stat(path):
+        # 在 flush_pending 取出待处理事件之后、读取文件之前完成重命名
+        if path == tmp_path:
+            os.replace(tmp_path, dest_path)
+            handler.on_moved(FileMovedEvent(tmp_path, dest_path))
+        return stat_file(path)
+    file_manager._stat_file = rename_then_stat
+
+    handler.flush_pending()
+    assert tmp_path not in file_manager.files
+    handler.flush_pending()
+    assert dest_path in file_manager.files
+
+def test_delete_during_flush(file_manager, temp_dir):
+    """测试读取文件信息之后收到删除事件时不再记录该文件"""
+    from watchdog.events import FileCreatedEvent, FileDeletedEvent
+    from file_tag_manager.core.file_manager import FileEventHandler
+
+    events = []
+    file_manager.add_file_change_callback(lambda *args: events.append(args[:2]))
+    handler = FileEventHandler(file_manager)
+    file_path = os.path.join(temp_dir, "short_lived.txt")
+    create_test_file(file_path)
+    handler.on_created(FileCreatedEvent(file_path))
+
+    stat_file = file_manager._stat_file
+    def stat_then_delete(path):
+        # 读取成功之后、记录之前文件被删除
+        result = stat_file(path)
+        os.remove(path)
+        handler.on_deleted(FileDeletedEvent(path))
+        return result
+    file_manager._stat_file = stat_then_delete
+
+    handler.flush_pending()
+    assert file_path not in file_manager.files
+    assert events == []
+
+def test_remove_directory_order(file_manager, temp_dir):
+    """测试删除目录时自底向上发出通知"""
+    nested_file = os.path.join(temp_dir, "a", "b", "nested.txt")
+    create_test_file(nested_file)
+    file_manager._scan_directory(temp_dir)
+
+    events = []
+    file_manager.add_file_change_callback(lambda *args: events.append(args[:2]))
+    file_manager._remove_directory(os.path.join(temp_dir, "a"))
+    assert events == [
+        ('deleted', nested_file),
+        ('directory_deleted', os.path.join(temp_dir, "a", "b")),
+        ('directory_deleted', os.path.join(temp_dir, "a")),
+    ]
@@ -1,6 +1,7 @@
 """标签管理器测试"""
 import os
 import json
+import sys
 import pytest
 from file_tag_manager.core import TagManager
 
@@ -33,6 +34,36 @@ def test_create_tag(tag_manager):
     assert child_tag_id in tag_manager.tags
     assert tag_manager.tags[child_tag_id].parent == tag_id
 
+def test_get_tags(tag_manager):
+    """测试批量获取标签"""
+    tag1 = tag_manager.create_tag("标签1", "描述1")
+    tag2 = tag_manager.create_tag("标签2")
+
+    tags = tag_manager.get_tags([tag1, tag2, "不存在"])
+    assert set(tags) == {tag1, tag2}
+    assert tags[tag1].description == "描述1"
+
+def test_remove_tag(tag_manager):
+    """测试删除标签及其子标签"""
+    parent = tag_manager.create_tag("父标签")
+    child = tag_manager.create_tag("子标签", parent=parent)
+    other = tag_manager.create_tag("其他")
+
+    file1 = normalize_path("/test/file1.txt")
+    file2 = normalize_path("/test/file2.txt")
+    tag_manager.add_tags_to_file(file1, [parent, other])
+    tag_manager.add_tag_to_file(file2, child)
+
+    tag_manager.remove_tag(parent)
+    assert parent not in tag_manager.tags
+    assert child not in tag_manager.tags
+    assert tag_manager.get_file_tags(file1) == {other}
+    assert file2 not in tag_manager.file_tags
+    assert tag_manager.find_files_by_tags([other]) == [file1]
+
+    with pytest.raises(ValueError):
+        tag_manager.remove_tag(parent)
+
 def test_add_file_tags(tag_manager):
     """测试为文件添加标签"""
     # 创建测试标签
@@ -66,6 +97,23 @@ def test_remove_file_tags(tag_manager):
     tag_manager.remove_tag_from_file(file_path, tag2)
     assert file_path not in tag_manager.file_tags
 
+def test_batch_file_tags(tag_manager):
+    """测试批量添加和移除文件标签"""
+    tag1 = tag_manager.create_tag("标签1")
+    tag2 = tag_manager.create_tag("标签2")
+    file_path = normalize_path("/test/file.txt")
+
+    tag_manager.add_tags_to_file(file_path, [tag1, tag2])
+    assert tag_manager.get_file_tags(file_path) == {tag1, tag2}
+
+    # 包含不存在的标签时不做任何修改
+    with pytest.raises(ValueError):
+        tag_manager.add_tags_to_file(normalize_path("/test/other.txt"), [tag1, "不存在"])
+    assert normalize_path("/test/other.txt") not in tag_manager.file_tags
+
+    tag_manager.remove_tags_from_file(file_path, [tag1, tag2])
+    assert file_path not in tag_manager.file_tags
+
 def test_get_file_tags(tag_manager):
     """测试获取文件的标签"""
     # 创建测试标签
@@ -115,6 +163,41 @@ def test_find_files_by_tags(tag_manager):
     assert file2 in files
     assert file3 in files
 
+def test_find_files_by_tags_index(tag_manager):
+    """测试标签倒排索引随修改更新"""
+    tag1 = tag_manager.create_tag("标签1")
+    tag2 = tag_manager.create_tag("标签2")
+    unused = tag_manager.create_tag("未使用")
+    file1 = normalize_path("/test/file1.txt")
+    file2 = normalize_path("/test/file2.txt")
+    tag_manager.add_tags_to_file(file1, [tag1, tag2])
+    tag_manager.add_tag_to_file(file2, tag1)
+
+    # 任一标签没有文件时交集为空
+    assert tag_manager.find_files_by_tags([tag1, unused], match_all=True) == []
+    assert tag_manager.find_files_by_tags([tag1, unused]) == [file1, file2]
+    assert tag_manager.find_files_by_tags([]) == []
+
+    tag_manager.remove_tag_from_file(file1, tag2)
+    assert tag_manager.find_files_by_tags([tag1, tag2], match_all=True) == []
+    assert tag2 not in tag_manager._tag_to_files
+
+    with pytest.raises(ValueError):
+        tag_manager.find_files_by_tags([tag1, "不存在"])
+
+def test_find_files_under(tag_manager):
+    """测试按目录前缀过滤查找结果"""
+    tag1 = tag_manager.create_tag("标签1")
+    inside = normalize_path("/test/docs/file.txt")
+    nested = normalize_path("/test/docs/sub/file.txt")
+    sibling = normalize_path("/test/docs2/file.txt")
+    for file_path in (inside, nested, sibling):
+        tag_manager.add_tag_to_file(file_path, tag1)
+
+    assert tag_manager.find_files_by_tags([tag1], under="/test/docs") == [inside, nested]
+    assert tag_manager.find_files_by_tags([tag1], under="/test/docs/") == [inside, nested]
+    assert tag_manager.find_files_by_tags([tag1], under="/other") == []
+
 def test_data_persistence(temp_tag_file):
     """测试数据持久化"""
     # 创建标签并保存
@@ -130,3 +213,59 @@ def test_data_persistence(temp_tag_file):
     assert tag_manager2.tags[tag1].description == "描述1"
     assert file_path in tag_manager2.file_tags
     assert tag1 in tag_manager2.file_tags[file_path]
+
+def test_log_compaction(temp_tag_file):
+    """测试操作日志重放与合并"""
+    config_dir = os.path.dirname(temp_tag_file)
+    tag_manager1 = TagManager(config_dir=config_dir)
+    tag1 = tag_manager1.create_tag("标签1")
+    tag2 = tag_manager1.create_tag("标签2", parent=tag1)
+    file_path = normalize_path("/test/file.txt")
+    tag_manager1.add_tags_to_file(file_path, [tag1, tag2])
+    tag_manager1.remove_tag_from_file(file_path, tag1)
+
+    # 修改只追加到日志，不重写快照
+    assert os.path.exists(tag_manager1.log_file)
+    assert not os.path.exists(tag_manager1.tags_file)
+    assert TagManager(config_dir=config_dir).get_file_tags(file_path) == {tag2}
+
+    tag_manager1.compact()
+    assert not os.path.exists(tag_manager1.log_file)
+    with open(tag_manager1.tags_file, encoding='utf-8') as f:
+        assert json.load(f)['file_tags'] == {file_path: [tag2]}
+
+    # 合并后的修改继续追加到日志
+    tag_manager1.remove_tag(tag1)
+    tag_manager2 = TagManager(config_dir=config_dir)
+    assert not tag_manager2.tags
+    assert file_path not in tag_manager2.file_tags
+
+def test_interned_file_paths(tag_manager):
+    """测试文件路径键被驻留"""
+    tag1 = tag_manager.create_tag("标签1")
+    file_path = "".join(["/test/", "file.txt"])
+    tag_manager.add_tag_to_file(normalize_path(file_path), tag1)
+    key = next(iter(tag_manager.file_tags))
+    assert key is sys.intern(normalize_path("/test/file.txt"))
+
+def test_empty_snapshot(temp_tag_file):
+    """测试空的快照文件视为没有数据"""
+    config_dir = os.path.dirname(temp_tag_file)
+    open(os.path.join(config_dir, "tags.json"), "wb").close()
+    tag_manager = TagManager(config_dir=config_dir)
+    assert not tag_manager.tags
+    assert not tag_manager.file_tags
+
+def test_truncated_log_record(temp_tag_file):
+    """测试崩溃留下的不完整日志记录不会影响之后追加的记录"""
+    config_dir = os.path.dirname(temp_tag_file)
+    tag_manager1 = TagManager(config_dir=config_dir)
+    tag1 = tag_manager1.create_tag("标签1")
+    with open(tag_manager1.log_file, "ab") as f:
+        f.write(b'{"op":"add_file_ta')
+
+    tag_manager2 = TagManager(config_dir=config_dir)
+    tag2 = tag_manager2.create_tag("标签2")
+
+    tag_manager3 = TagManager(config_dir=config_dir)
+    assert set(tag_manager3.tags) == {tag1, tag2}